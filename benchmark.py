@@ -0,0 +1,777 @@
+#!/usr/bin/env python3
+# Offline benchmarks for CivitAI-CLI. A local stand-in for the CivitAI API with
+# configurable latency, bandwidth, error rate and payload size serves scripted
+# scenarios that run against APIHandler and Downloader. Results can be stored
+# as a baseline and later runs are compared against it. Synthetic model libraries
+# of sparse files are generated for the scan scenario or on their own.
+
+# Standard library imports
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Third-party imports
+from termcolor import colored
+
+import main
+
+SCENARIOS = ['listing', 'metadata', 'download', 'scan']
+
+# Folder, share of the files, apparent size in MB, tensor names of the safetensors header, share of .ckpt files
+LIBRARY_LAYOUT = [
+    ("models/Stable-diffusion", 0.12, 2048, ['model.diffusion_model.input_blocks.0.0.weight', 'cond_stage_model.transformer.text_model.final_layer_norm.weight'], 0.5),
+    ("embeddings", 0.15, 0.05, ['emb_params'], 0),
+    ("models/hypernetworks", 0.02, 80, ['linear.0.weight'], 0.5),
+    ("extensions/stable-diffusion-webui-aesthetic-gradients/aesthetic_embeddings", 0.01, 0.01, ['embedding'], 0),
+    ("models/Lora", 0.47, 144, ['lora_unet_down_blocks_0_attentions_0_proj_in.lora_down.weight', 'lora_unet_down_blocks_0_attentions_0_proj_in.lora_up.weight'], 0),
+    ("models/Controlnet", 0.04, 1400, ['control_model.input_blocks.0.0.weight'], 0.2),
+    ("models/ESRGAN", 0.03, 64, ['model.0.weight'], 0.5),
+    ("models/MotionModule", 0.02, 1700, ['down_blocks.0.motion_modules.0.temporal_transformer.norm.weight'], 0.5),
+    ("models/VAE", 0.04, 320, ['encoder.conv_in.weight', 'decoder.conv_out.weight'], 0.2),
+    ("models/Poses", 0.02, 1, ['pose'], 0),
+    ("models/Wildcards", 0.02, 0.1, ['wildcard'], 0),
+    ("models/Workflows", 0.02, 0.1, ['workflow'], 0),
+    ("models/Other", 0.04, 200, ['weight'], 0.2),
+]
+
+
+def model_file_content(version_id, size=64 * 1024):
+    # Small but distinct safetensors file per version, the fake API knows its hash
+    header = json.dumps({"__metadata__": {"format": "pt", "benchmark_version": str(version_id)}}).encode('utf-8')
+    header += b' ' * (-len(header) % 8)
+    body = struct.pack('<Q', len(header)) + header
+    return body + (f"civitai-benchmark-{version_id}".encode('utf-8') * (size // 24 + 1))[:max(size - len(body), 0)]
+
+
+class LibraryGenerator:
+    # Builds a model library in the layout the CLI scans. Model files are sparse: a real
+    # safetensors header (or a zip signature for .ckpt) followed by a hole up to the
+    # apparent size, so thousands of multi-GB files cost almost no disk space.
+    def __init__(self, root, files=2000, sidecar_coverage=0.5, seed=0):
+        self.root = root
+        self.files = files
+        self.sidecar_coverage = sidecar_coverage
+        self.random = random.Random(seed)
+        self.preview_image = None
+
+    @staticmethod
+    def model_files(root):
+        for folder, *_ in LIBRARY_LAYOUT:
+            directory = os.path.join(root, folder)
+            if os.path.isdir(directory):
+                for name in os.listdir(directory):
+                    if name.endswith(('.ckpt', '.pt', '.safetensors')):
+                        yield os.path.join(directory, name)
+
+    @staticmethod
+    def file_state(root):
+        state = {}
+        for folder, _, names in os.walk(root):
+            for name in names:
+                stat = os.stat(os.path.join(folder, name))
+                state[os.path.join(folder, name)] = (stat.st_size, stat.st_mtime_ns)
+        return state
+
+    def generate(self):
+        created = []
+        for folder, share, size_mb, tensor_names, ckpt_share in LIBRARY_LAYOUT:
+            directory = os.path.join(self.root, folder)
+            os.makedirs(directory, exist_ok=True)
+            for _ in range(max(1, round(self.files * share))):
+                index = len(created)
+                extension = '.ckpt' if self.random.random() < ckpt_share else '.safetensors'
+                # Spread the apparent sizes around the typical size of the folder
+                size = int(size_mb * 1024 * 1024 * self.random.uniform(0.5, 1.5))
+                file_path = os.path.join(directory, f"synthetic-{index:06d}{extension}")
+                self.write_model_file(file_path, size, tensor_names)
+                if self.random.random() < self.sidecar_coverage:
+                    self.write_sidecars(file_path, index)
+                created.append(file_path)
+        return created
+
+    @staticmethod
+    def write_model_file(file_path, size, tensor_names):
+        with open(file_path, 'wb') as f:
+            if file_path.endswith('.ckpt'):
+                f.write(b'PK\x03\x04')  # Pickled checkpoints are zip archives
+            else:
+                data_size = max(size - 4096, 0)
+                header = {name: {'dtype': 'F16', 'shape': [data_size // (2 * len(tensor_names))],
+                                 'data_offsets': [i * data_size // len(tensor_names), (i + 1) * data_size // len(tensor_names)]}
+                          for i, name in enumerate(tensor_names)}
+                header['__metadata__'] = {'format': 'pt'}
+                encoded = json.dumps(header).encode('utf-8')
+                f.write(struct.pack('<Q', len(encoded)) + encoded)
+            f.truncate(max(size, f.tell()))
+
+    def write_sidecars(self, file_path, index):
+        base_path = os.path.splitext(file_path)[0]
+        file_hash = hashlib.sha256(file_path.encode('utf-8')).hexdigest()
+        info = {
+            'id': 500000 + index,
+            'modelId': 50000 + index,
+            'name': 'v1.0',
+            'model': {'name': f"Synthetic Model {index}", 'type': 'LORA'},
+            'files': [{'name': os.path.basename(file_path), 'hashes': {'SHA256': file_hash.upper()}}],
+        }
+        with open(f"{base_path}.civitai.info", 'w') as f:
+            json.dump(info, f, indent=4)
+        with open(f"{base_path}.json", 'w') as f:
+            json.dump({'description': '', 'sd version': 'SD1', 'activation text': 'synthetic'}, f, indent=4)
+        if self.preview_image is None:
+            self.preview_image = FakeCivitAI.create_preview_image((64, 96))
+        with open(f"{base_path}.preview.png", 'wb') as f:
+            f.write(self.preview_image)
+
+
+class FakeCivitAI:
+    # Deterministic catalog of models, versions and files served by the fake API
+    def __init__(self, models=200, payload_kb=4, file_size_mb=1):
+        self.model_ids = [1000 + i for i in range(models)]
+        self.known_models = set(self.model_ids)
+        self.file_size = int(file_size_mb * 1024 * 1024)
+        paragraph = "<p>Benchmark model trained for <strong>reproducible</strong> measurements. </p>"
+        self.description = paragraph * max(1, int(payload_kb * 1024 / len(paragraph)))
+        self.hashes = {hashlib.sha256(model_file_content(self.version_id(model_id))).hexdigest(): model_id for model_id in self.model_ids}
+        self.base_url = ''
+        self.preview_image = self.create_preview_image()
+
+    @staticmethod
+    def version_id(model_id):
+        return model_id * 100
+
+    @staticmethod
+    def create_preview_image(size=(512, 768)):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (90, 120, 200)).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def version(self, model_id):
+        version_id = self.version_id(model_id)
+        file_hash = hashlib.sha256(model_file_content(version_id)).hexdigest()
+        return {
+            'id': version_id,
+            'modelId': model_id,
+            'name': 'v1.0',
+            'baseModel': 'SD 1.5',
+            'createdAt': '2024-01-01T00:00:00.000Z',
+            'trainedWords': ['benchmark'],
+            'downloadUrl': f"{self.base_url}/api/download/models/{version_id}",
+            'files': [{
+                'id': version_id,
+                'name': f"benchmark-{version_id}.safetensors",
+                'sizeKB': self.file_size / 1024,
+                'type': 'Model',
+                'primary': True,
+                'metadata': {'format': 'SafeTensor', 'fp': 'fp16', 'size': 'pruned'},
+                'hashes': {'SHA256': file_hash.upper()},
+            }],
+            'images': [{'url': f"{self.base_url}/images/{version_id}.png", 'nsfw': 'None', 'width': 512, 'height': 768}],
+        }
+
+    def model(self, model_id):
+        return {
+            'id': model_id,
+            'name': f"Benchmark Model {model_id}",
+            'type': 'LORA',
+            'nsfw': False,
+            'description': self.description,
+            'tags': ['benchmark', 'style'],
+            'creator': {'username': 'benchmark'},
+            'stats': {'downloadCount': model_id * 7, 'favoriteCount': model_id, 'rating': 4.8, 'ratingCount': 12},
+            'modelVersions': [self.version(model_id)],
+        }
+
+    def version_with_model(self, model_id):
+        version = self.version(model_id)
+        version['model'] = {'name': f"Benchmark Model {model_id}", 'type': 'LORA', 'nsfw': False}
+        return version
+
+
+class FakeCivitAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so pooled sessions behave as against the real API
+    disable_nagle_algorithm = True  # Headers and body are separate writes, avoid delayed-ACK stalls
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body):
+        server = self.server
+        url = urlparse(self.path)
+        path = url.path
+        if server.latency:
+            time.sleep(server.latency)
+        server.count_request()
+        if path.startswith('/api/') and server.should_fail():
+            return self.send_json({'error': 'Injected server error'}, status=500, send_body=send_body)
+
+        catalog = server.catalog
+        if path == '/api/v1/models':
+            query = parse_qs(url.query)
+            limit = int(query.get('limit', ['20'])[0])
+            page = int(query.get('page', ['1'])[0])
+            page_ids = catalog.model_ids[(page - 1) * limit:page * limit]
+            total_pages = max(1, -(-len(catalog.model_ids) // limit))
+            return self.send_json({
+                'items': [catalog.model(model_id) for model_id in page_ids],
+                'metadata': {'totalItems': len(catalog.model_ids), 'currentPage': page, 'pageSize': limit, 'totalPages': total_pages},
+            }, send_body=send_body)
+
+        match = re.fullmatch(r'/api/v1/models/(\d+)', path)
+        if match and int(match.group(1)) in catalog.known_models:
+            return self.send_json(catalog.model(int(match.group(1))), send_body=send_body)
+
+        match = re.fullmatch(r'/api/v1/model-versions/(\d+)', path)
+        if match and int(match.group(1)) // 100 in catalog.known_models:
+            return self.send_json(catalog.version_with_model(int(match.group(1)) // 100), send_body=send_body)
+
+        match = re.fullmatch(r'/api/v1/model-versions/by-hash/(\w+)', path)
+        if match and match.group(1).lower() in catalog.hashes:
+            return self.send_json(catalog.version_with_model(catalog.hashes[match.group(1).lower()]), send_body=send_body)
+
+        match = re.fullmatch(r'/api/download/models/(\d+)', path)
+        if match:
+            version_id = int(match.group(1))
+            self.send_response(307)
+            self.send_header('Location', f"{catalog.base_url}/files/{version_id}/benchmark-{version_id}.safetensors")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        match = re.fullmatch(r'/files/(\d+)/([\w.-]+)', path)
+        if match:
+            return self.send_file(int(match.group(1)), match.group(2), send_body)
+
+        if re.fullmatch(r'/images/\d+\.png', path):
+            return self.send_body(catalog.preview_image, 'image/png', send_body=send_body)
+
+        self.send_json({'error': 'Not found'}, status=404, send_body=send_body)
+
+    def send_json(self, data, status=200, send_body=True):
+        self.send_body(json.dumps(data).encode('utf-8'), 'application/json', status, send_body)
+
+    def send_body(self, body, content_type, status=200, send_body=True, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            self.server.throttled_write(self.wfile, body)
+
+    def send_file(self, version_id, file_name, send_body):
+        body = self.server.download_body(version_id)
+        headers = {'Content-Disposition': f'attachment; filename="{file_name}"', 'Accept-Ranges': 'bytes'}
+        range_match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if range_match:
+            start = int(range_match.group(1))
+            end = int(range_match.group(2)) if range_match.group(2) else len(body) - 1
+            headers['Content-Range'] = f"bytes {start}-{end}/{len(body)}"
+            return self.send_body(body[start:end + 1], 'application/octet-stream', 206, send_body, headers)
+        self.send_body(body, 'application/octet-stream', send_body=send_body, headers=headers)
+
+
+class FakeCivitAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, catalog, latency_ms=0, bandwidth_mbps=0, error_rate=0.0, seed=0):
+        super().__init__(('127.0.0.1', 0), FakeCivitAIHandler)
+        self.catalog = catalog
+        self.catalog.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.latency = latency_ms / 1000
+        self.bandwidth = bandwidth_mbps * 1024 * 1024  # Bytes per second per connection, 0 means unlimited
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.download_bodies = {}
+        self.thread = None
+
+    @property
+    def url(self):
+        return self.catalog.base_url
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def download_body(self, version_id):
+        with self.lock:
+            if version_id not in self.download_bodies:
+                self.download_bodies[version_id] = model_file_content(version_id, self.catalog.file_size)
+            return self.download_bodies[version_id]
+
+    def throttled_write(self, wfile, body):
+        try:
+            if not self.bandwidth:
+                wfile.write(body)
+                return
+            for offset in range(0, len(body), self.CHUNK_SIZE):
+                chunk = body[offset:offset + self.CHUNK_SIZE]
+                wfile.write(chunk)
+                time.sleep(len(chunk) / self.bandwidth)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeAria2RPCHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        try:
+            result = self.server.dispatch(request.get('method', ''), list(request.get('params', [])))
+            response = {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+        except ValueError as e:
+            response = {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': 1, 'message': str(e)}}
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeAria2RPC(ThreadingHTTPServer):
+    # Stand-in for 'aria2c --enable-rpc' when aria2c is not installed. It checks the
+    # calls the CLI makes and downloads with requests, honouring the global speed limit.
+    daemon_threads = True
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, secret=None):
+        super().__init__(('127.0.0.1', 0), FakeAria2RPCHandler)
+        self.secret = secret
+        self.lock = threading.Lock()
+        self.downloads = {}  # gid -> status
+        self.limit = 0
+        self.limit_changes = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def dispatch(self, method, params):
+        if self.secret and (not params or params.pop(0) != f"token:{self.secret}"):
+            raise ValueError("Unauthorized")
+        if not method.startswith('aria2.'):
+            raise ValueError(f"Method not found: {method}")
+        method = method[len('aria2.'):]
+        if method == 'getVersion':
+            return {'version': 'fake', 'enabledFeatures': []}
+        if method == 'addUri':
+            if not params or not isinstance(params[0], list) or not all(isinstance(uri, str) for uri in params[0]):
+                raise ValueError("addUri expects a list of URIs")
+            options = params[1] if len(params) > 1 else {}
+            if 'dir' not in options:
+                raise ValueError("addUri without a download directory")
+            return self.add_download(params[0][0], options['dir'])
+        if method == 'tellStatus':
+            return self.status(params[0], params[1] if len(params) > 1 else None)
+        if method in ('tellActive', 'tellWaiting', 'tellStopped'):
+            keys = params[-1] if params and isinstance(params[-1], list) else None
+            wanted = {'tellActive': ('active',), 'tellWaiting': ('waiting',), 'tellStopped': ('complete', 'error', 'removed')}[method]
+            with self.lock:
+                gids = [gid for gid, download in self.downloads.items() if download['status'] in wanted]
+            return [self.status(gid, keys) for gid in gids]
+        if method == 'changeGlobalOption':
+            limit = params[0].get('max-overall-download-limit')
+            if limit is not None:
+                if not str(limit).isdigit():
+                    raise ValueError(f"Invalid max-overall-download-limit: {limit}")
+                self.limit = int(limit)
+                self.limit_changes.append(self.limit)
+            return 'OK'
+        if method == 'shutdown':
+            return 'OK'
+        raise ValueError(f"Method not found: aria2.{method}")
+
+    def add_download(self, uri, directory):
+        gid = os.urandom(8).hex()
+        with self.lock:
+            self.downloads[gid] = {'gid': gid, 'status': 'active', 'totalLength': '0', 'completedLength': '0', 'downloadSpeed': '0', 'errorMessage': ''}
+        threading.Thread(target=self.download, args=(gid, uri, directory), daemon=True).start()
+        return gid
+
+    def download(self, gid, uri, directory):
+        download = self.downloads[gid]
+        try:
+            with main.requests.get(uri, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                match = re.search(r'filename="([^"]+)"', response.headers.get('Content-Disposition', ''))
+                file_name = os.path.basename(match.group(1) if match else urlparse(response.url).path)
+                download['totalLength'] = response.headers.get('Content-Length', '0')
+                start = time.monotonic()
+                with open(os.path.join(directory, file_name), 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                        f.write(chunk)
+                        completed = int(download['completedLength']) + len(chunk)
+                        download['completedLength'] = str(completed)
+                        download['downloadSpeed'] = str(int(completed / max(time.monotonic() - start, 1e-6)))
+                        if self.limit:
+                            time.sleep(len(chunk) / self.limit)
+            download['status'] = 'complete'
+        except (main.requests.exceptions.RequestException, OSError) as e:
+            download.update(status='error', errorMessage=str(e))
+
+    def status(self, gid, keys=None):
+        with self.lock:
+            if gid not in self.downloads:
+                raise ValueError(f"GID {gid} is not found")
+            download = dict(self.downloads[gid])
+        return {key: value for key, value in download.items() if not keys or key in keys}
+
+
+class Recorder:
+    # Wall-clock samples of wrapped calls, in seconds
+    def __init__(self):
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def wrap(self, obj, name):
+        original = getattr(obj, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.samples.append(time.perf_counter() - start)
+        setattr(obj, name, timed)
+
+    def percentile(self, percent):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(1, -(-len(ordered) * percent // 100))  # Nearest rank
+        return ordered[int(rank) - 1]
+
+
+class Benchmark:
+    def __init__(self, args):
+        self.args = args
+
+    def server_config(self):
+        return {key: getattr(self.args, key) for key in ['latency_ms', 'bandwidth_mbps', 'error_rate', 'payload_kb', 'file_size_mb', 'models',
+                                                         'library_files', 'sidecar_coverage']}
+
+    def run(self, scenarios):
+        results = {}
+        for scenario in scenarios:
+            if scenario == 'download' and not shutil.which('aria2c'):
+                print(colored("⚠️ aria2c is not installed, the download scenario uses the RPC backend against a fake aria2.", "yellow"))
+            print(colored(f"⏳ Running {scenario}...", "cyan"))
+            results.update(self.run_scenario(scenario))
+        return results
+
+    def run_scenario(self, scenario):
+        catalog = FakeCivitAI(self.args.models, self.args.payload_kb, self.args.file_size_mb)
+        server = FakeCivitAIServer(catalog, self.args.latency_ms, self.args.bandwidth_mbps, self.args.error_rate, self.args.seed).start()
+        previous_urls = main.APIHandler.BASE_URL, main.Downloader.DOWNLOAD_URL
+        main.APIHandler.BASE_URL = f"{server.url}/api/v1/"
+        main.Downloader.DOWNLOAD_URL = f"{server.url}/api/download/models/"
+        previous_directory = os.getcwd()
+        work_directory = tempfile.mkdtemp(prefix='civitai-benchmark-')
+        try:
+            # Settings, index and queues are read from and written to the working directory
+            os.chdir(work_directory)
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                components = main.BatchCLI.create_components(os.path.join(work_directory, 'library'))
+                results = getattr(self, f"scenario_{scenario}")(catalog, *components)
+            for result in results.values():
+                result.setdefault('requests', server.requests)
+            return results
+        finally:
+            os.chdir(previous_directory)
+            shutil.rmtree(work_directory, ignore_errors=True)
+            main.APIHandler.BASE_URL, main.Downloader.DOWNLOAD_URL = previous_urls
+            server.stop()
+
+    @staticmethod
+    def summarize(recorder, elapsed, count, unit, errors=0):
+        return {
+            'p50_ms': round(recorder.percentile(50) * 1000, 2),
+            'p99_ms': round(recorder.percentile(99) * 1000, 2),
+            'throughput': round(count / elapsed, 2) if elapsed else 0.0,
+            'unit': unit,
+            'errors': errors,
+            'elapsed_s': round(elapsed, 3),
+        }
+
+    def scenario_listing(self, catalog, model_display, api_handler, settings_cli, downloader, main_cli):
+        # Fetch and render every page of the catalog, as the listing menu does
+        recorder = Recorder()
+        recorder.wrap(api_handler, 'get_models_with_default_query')
+        page, total_pages, rendered, errors = 1, 1, 0, 0
+        start = time.perf_counter()
+        while page <= total_pages:
+            models, metadata = api_handler.get_models_with_default_query({}, {'page': page, 'limit': self.args.page_size})
+            if models is None:
+                errors += 1
+                break
+            total_pages = metadata.get('totalPages', 1)
+            for model in models:
+                model_display.render_model_card(model, settings_cli.image_filter, None, settings_cli.image_filter_settings)
+            rendered += len(models)
+            page += 1
+        return {'listing': self.summarize(recorder, time.perf_counter() - start, rendered, 'models/s', errors)}
+
+    def scenario_metadata(self, catalog, model_display, api_handler, settings_cli, downloader, main_cli):
+        # Files without sidecars are hashed and looked up, as in "Scan and update metadata"
+        folder = os.path.join(downloader.default_download_dir, downloader.type_to_path['LORA'])
+        os.makedirs(folder, exist_ok=True)
+        for model_id in catalog.model_ids:
+            version_id = catalog.version_id(model_id)
+            with open(os.path.join(folder, f"benchmark-{version_id}.safetensors"), 'wb') as f:
+                f.write(model_file_content(version_id))
+        recorder = Recorder()
+        recorder.wrap(api_handler, 'get_json')
+        start = time.perf_counter()
+        downloader.scan_and_update_metadata([downloader.type_to_path['LORA']])
+        downloader.preview_pipeline.wait()
+        elapsed = time.perf_counter() - start
+        missing = sum(1 for name in os.listdir(folder) if name.endswith('.safetensors')
+                      and not os.path.exists(os.path.join(folder, name.replace('.safetensors', '.civitai.info'))))
+        return {'metadata': self.summarize(recorder, elapsed, len(catalog.model_ids), 'files/s', missing)}
+
+    def scenario_download(self, catalog, model_display, api_handler, settings_cli, downloader, main_cli):
+        fake_aria2 = None
+        settings_cli.download_backend = self.args.download_backend
+        if not shutil.which('aria2c'):
+            fake_aria2 = FakeAria2RPC().start()
+            settings_cli.download_backend = 'rpc'
+            downloader.aria2_rpc = main.Aria2RPCClient('127.0.0.1', fake_aria2.port, bandwidth_limiter=downloader.bandwidth_limiter)
+        try:
+            return self.run_downloads(catalog, downloader)
+        finally:
+            if fake_aria2:
+                fake_aria2.stop()
+
+    def run_downloads(self, catalog, downloader):
+        recorder = Recorder()
+        recorder.wrap(downloader, 'download_model_by_id')
+        target = os.path.join(downloader.default_download_dir, downloader.type_to_path['LORA'])
+        failed = []
+        model_ids = catalog.model_ids[:self.args.downloads]
+        start = time.perf_counter()
+        downloaded = [downloader.download_model_by_id(catalog.version_id(model_id), target, 'LORA', silent=True, failed_downloads_list=failed) for model_id in model_ids]
+        downloader.preview_pipeline.wait()
+        elapsed = time.perf_counter() - start
+        # Only count the model files that actually arrived, not the sidecars
+        sidecars = ('.civitai.info', '.json', '.preview.png')
+        downloaded_bytes = sum(os.path.getsize(os.path.join(target, file_name)) for file_name in os.listdir(target) if not file_name.endswith(sidecars)) if os.path.isdir(target) else 0
+        return {'download': self.summarize(recorder, elapsed, downloaded_bytes / (1024 * 1024), 'MB/s', downloaded.count(False))}
+
+    def scenario_scan(self, catalog, model_display, api_handler, settings_cli, downloader, main_cli):
+        # Time the directory scan over a synthetic library: from an empty index, again with
+        # everything indexed, and after one file was added, hashed or deleted
+        root = self.args.library or settings_cli.root_directory
+        if not self.args.library:
+            LibraryGenerator(root, self.args.library_files, self.args.sidecar_coverage, self.args.seed).generate()
+        downloader.default_download_dir = root  # "Scan for missing data" walks the downloader's root
+        files = sum(1 for _ in LibraryGenerator.model_files(root))
+        added_size = 144 * 1024 * 1024
+        added_path = os.path.join(root, 'models/Lora', 'benchmark-added.safetensors')
+        # A library given with --library is only read, never modified, which is checked after the run
+        library_state = LibraryGenerator.file_state(root) if self.args.library else None
+        phase_names = ['scan-cold', 'scan-warm'] if self.args.library else ['scan-cold', 'scan-warm', 'scan-add', 'scan-hash', 'scan-delete']
+        phases = {name: Recorder() for name in phase_names}
+
+        def timed_scan(phase):
+            start = time.perf_counter()
+            main_cli.scan_directory_for_models(root, quiet=True)
+            phases[phase].samples.append(time.perf_counter() - start)
+
+        for _ in range(self.args.scan_runs):
+            main_cli.index.update(lambda model_index: model_index.clear()).result()
+            timed_scan('scan-cold')
+        for _ in range(self.args.scan_runs):
+            timed_scan('scan-warm')
+        if not self.args.library:
+            # Only the added file is left for the hash worker, as in a library whose hashes are done
+            def mark_hashed(model_index):
+                for model in model_index.values():
+                    model.pop('hash_pending', None)
+            main_cli.index.update(mark_hashed).result()
+        for _ in range(self.args.scan_runs if not self.args.library else 0):
+            LibraryGenerator.write_model_file(added_path, added_size, LIBRARY_LAYOUT[4][3])
+            timed_scan('scan-add')
+            start = time.perf_counter()
+            main_cli.hash_pending_models()  # What the hash worker runs once the CLI is idle
+            phases['scan-hash'].samples.append(time.perf_counter() - start)
+            os.remove(added_path)
+            timed_scan('scan-delete')
+
+        results = {}
+        for phase, recorder in phases.items():
+            median = recorder.percentile(50)
+            if phase == 'scan-hash':
+                results[phase] = self.summarize(recorder, median, added_size / (1024 * 1024), 'MB/s')
+            else:
+                results[phase] = self.summarize(recorder, median, files, 'files/s')
+            results[phase]['requests'] = 0
+
+        if self.args.scan_metadata:
+            # Hashes and looks up every file without sidecars, the fake API does not know them
+            recorder = Recorder()
+            recorder.wrap(downloader, 'generate_sha256')
+            missing = sum(1 for file_path in LibraryGenerator.model_files(root)
+                          if not os.path.exists(os.path.splitext(file_path)[0] + '.civitai.info'))
+            start = time.perf_counter()
+            downloader.scan_and_update_metadata()
+            results['scan-metadata'] = self.summarize(recorder, time.perf_counter() - start, missing, 'files/s')
+        if library_state is not None:
+            current_state = LibraryGenerator.file_state(root)
+            changed = sorted(path for path in library_state.keys() | current_state.keys() if library_state.get(path) != current_state.get(path))
+            if changed:
+                raise RuntimeError(f"The scan modified {len(changed)} files in {root}, e.g. {', '.join(changed[:5])}")
+        return results
+
+
+class Baseline:
+    LOWER_IS_BETTER = ['p50_ms', 'p99_ms']
+    HIGHER_IS_BETTER = ['throughput']
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, config, results):
+        baseline = self.load() or {'config': config, 'scenarios': {}}
+        if baseline.get('config') != config:
+            baseline = {'config': config, 'scenarios': {}}
+        baseline['scenarios'].update(results)
+        with open(self.path, 'w') as f:
+            json.dump(baseline, f, indent=4)
+        print(colored(f"💾 Baseline saved to {self.path}", "green"))
+
+    def compare(self, config, results, tolerance):
+        baseline = self.load()
+        if baseline is None:
+            print(colored(f"No baseline at {self.path}. Use --save-baseline to create one.", "yellow"))
+            return []
+        if baseline.get('config') != config:
+            print(colored("⚠️ The baseline was recorded with different server settings, not comparing.", "yellow"))
+            return []
+        regressions = []
+        for scenario, result in results.items():
+            previous = baseline.get('scenarios', {}).get(scenario)
+            if not previous:
+                continue
+            for metric in self.LOWER_IS_BETTER + self.HIGHER_IS_BETTER:
+                old, new = previous.get(metric), result.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                worse = change > tolerance if metric in self.LOWER_IS_BETTER else change < -tolerance
+                color = "red" if worse else "green"
+                print(colored(f"  {scenario:<14} {metric:<11} {old:>10} -> {new:<10} ({change:+.1%})", color))
+                if worse:
+                    regressions.append((scenario, metric))
+        return regressions
+
+
+def print_results(results):
+    print(colored(f"\n{'Scenario':<14} {'p50 ms':>10} {'p99 ms':>10} {'Throughput':>18} {'Errors':>7} {'Requests':>9}", "yellow"))
+    for scenario, result in results.items():
+        throughput = f"{result['throughput']} {result['unit']}"
+        print(f"{scenario:<14} {result['p50_ms']:>10} {result['p99_ms']:>10} {throughput:>18} {result['errors']:>7} {result['requests']:>9}")
+
+
+def build_parser():
+    library_options = argparse.ArgumentParser(add_help=False)
+    library_options.add_argument('--library-files', type=int, default=2000, help="Model files in the synthetic library")
+    library_options.add_argument('--sidecar-coverage', type=float, default=0.5, help="Share of model files with .civitai.info, .json and .preview.png")
+    library_options.add_argument('--seed', type=int, default=0, help="Seed of the error injection and the library generator")
+
+    parser = argparse.ArgumentParser(description="Offline CivitAI-CLI benchmarks against a local fake CivitAI API.", parents=[library_options])
+    subparsers = parser.add_subparsers(dest='command')
+    generate_parser = subparsers.add_parser('generate-library', parents=[library_options], help="Only generate a synthetic model library")
+    generate_parser.add_argument('directory', help="Root directory of the library")
+
+    parser.add_argument('--scenario', choices=['all'] + SCENARIOS, default='all')
+    parser.add_argument('--latency-ms', type=float, default=20, help="Added latency per request")
+    parser.add_argument('--bandwidth-mbps', type=float, default=0, help="Per-connection bandwidth in MB/s, 0 for unlimited")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of API requests answered with HTTP 500")
+    parser.add_argument('--payload-kb', type=float, default=4, help="Size of each model description")
+    parser.add_argument('--file-size-mb', type=float, default=8, help="Size of each downloaded file")
+    parser.add_argument('--models', type=int, default=200, help="Models in the fake catalog")
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--downloads', type=int, default=20, help="Files in the download batch")
+    parser.add_argument('--download-backend', choices=['process', 'rpc'], default='process', help="aria2 backend of the download scenario")
+    parser.add_argument('--library', type=os.path.abspath, help="Scan an existing library instead of a generated one")
+    parser.add_argument('--scan-runs', type=int, default=3, help="Repetitions of each scan phase")
+    parser.add_argument('--scan-metadata', action='store_true', help="Also hash and look up every library file without sidecars")
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help="Baseline file")
+    parser.add_argument('--save-baseline', action='store_true', help="Store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown before a change counts as a regression")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.command == 'generate-library':
+        created = LibraryGenerator(args.directory, args.library_files, args.sidecar_coverage, args.seed).generate()
+        print(colored(f"✅ Generated {len(created)} model files in {args.directory}", "green"))
+        sys.exit(0)
+    benchmark = Benchmark(args)
+    results = benchmark.run(SCENARIOS if args.scenario == 'all' else [args.scenario])
+    print_results(results)
+    baseline = Baseline(os.path.abspath(args.baseline))
+    if args.save_baseline:
+        baseline.save(benchmark.server_config(), results)
+        sys.exit(0)
+    regressions = baseline.compare(benchmark.server_config(), results, args.tolerance)
+    if regressions:
+        print(colored(f"❌ {len(regressions)} regressions beyond {args.tolerance:.0%}.", "red"))
+        sys.exit(1)
@@ -1,33 +1,100 @@
 # Standard library imports
+import argparse
+import atexit
+import base64
+import filecmp
 import hashlib
+import html
+import importlib.util
+import io
 import json
+import mmap
 import os
+import pydoc
+import queue
 import re
 import shutil
+import socket
+import socketserver
+import struct
 import subprocess
 import sys
 import tempfile
 import threading
 import time
-from tempfile import NamedTemporaryFile
+import types
+import zipfile
+from collections import Counter, deque
+from contextlib import contextmanager, redirect_stdout
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from urllib.parse import urlencode
 import imghdr
-import emoji
+try:
+    import fcntl
+except ImportError:  # Windows, index writes are then only serialized within this process
+    fcntl = None
+
+# Startup phase timings, shown with --debug or CIVITAI_CLI_DEBUG=1
+STARTUP_TIME = time.perf_counter()
+DEBUG_STARTUP = '--debug' in sys.argv or bool(os.environ.get('CIVITAI_CLI_DEBUG'))
+
+def log_startup_phase(phase):
+    if DEBUG_STARTUP:
+        print(f"⏱️ {phase}: {(time.perf_counter() - STARTUP_TIME) * 1000:.1f} ms", file=sys.stderr)
+
+def lazy_import(name):
+    # The module is only executed on first attribute access
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+LAZY_IMPORT_LOCK = threading.Lock()
+
+def ensure_imported(*modules):
+    # LazyLoader is not thread-safe before Python 3.12: a second thread can see the module
+    # half-executed. Worker pools therefore load the modules they use before they start.
+    with LAZY_IMPORT_LOCK:
+        for module in modules:
+            getattr(module, '__name__')  # Any attribute access executes the module
 
 # Related third-party imports
-import inquirer
-import requests
-from PIL import Image
-from bs4 import BeautifulSoup
-from inquirer import Checkbox, List, Text, prompt, Confirm
 from termcolor import colored
-from tqdm import tqdm
-from PIL import UnidentifiedImageError
 from subprocess import Popen, PIPE
 from colorama import Fore, Style
 
+# Heavy imports that are only needed once images are shown or the API is called
+np = lazy_import('numpy')
+requests = lazy_import('requests')
+Image = lazy_import('PIL.Image')
+
+# inquirer is only loaded once a menu is shown, batch commands never need it
+inquirer = lazy_import('inquirer')
+
+def prompt(*args, **kwargs):
+    return inquirer.prompt(*args, **kwargs)
+
+def List(*args, **kwargs):
+    return inquirer.List(*args, **kwargs)
+
+def Text(*args, **kwargs):
+    return inquirer.Text(*args, **kwargs)
+
+def Confirm(*args, **kwargs):
+    return inquirer.Confirm(*args, **kwargs)
+
+def Checkbox(*args, **kwargs):
+    return inquirer.Checkbox(*args, **kwargs)
+
 import signal
 import sys
 
+log_startup_phase("imports")
+
 def signal_handler(sig, frame):
     print('Ctrl+C shutting down now.')
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -36,14 +103,451 @@ def signal_handler(sig, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
+class ThreadOutput:
+    # Stand-in for sys.stdout that sends what a background thread prints to its own log
+    # file, so worker output never lands in the middle of an inquirer prompt
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def target(self):
+        return getattr(self.local, 'log_file', None) or self.stream
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    @classmethod
+    @contextmanager
+    def to_file(cls, path):
+        if not isinstance(sys.stdout, cls):
+            sys.stdout = cls(sys.stdout)
+        thread_output = sys.stdout
+        with open(path, 'a') as log_file:
+            thread_output.local.log_file = log_file
+            try:
+                yield
+            finally:
+                thread_output.local.log_file = None
+
+class Metrics:
+    # Counters, histograms, recent download/scan events and optional trace spans of this
+    # process, written as a Prometheus textfile and as JSON when a metrics directory is set
+    DEFINITIONS = {
+        'civitai_api_requests_total': ('counter', "CivitAI API requests by endpoint and HTTP status"),
+        'civitai_api_request_duration_seconds': ('histogram', "CivitAI API request latency by endpoint"),
+        'civitai_api_retries_total': ('counter', "Retried CivitAI API requests by endpoint"),
+        'civitai_cache_requests_total': ('counter', "Cache lookups by cache and result"),
+        'civitai_downloads_total': ('counter', "Finished downloads by source and result"),
+        'civitai_download_bytes_total': ('counter', "Downloaded bytes by source"),
+        'civitai_download_duration_seconds': ('histogram', "Download duration by source"),
+        'civitai_hash_bytes_total': ('counter', "Bytes hashed with SHA-256"),
+        'civitai_hash_duration_seconds_total': ('counter', "Time spent hashing with SHA-256"),
+        'civitai_scan_files_total': ('counter', "Model files visited by scans"),
+        'civitai_scan_duration_seconds': ('histogram', "Duration of directory and metadata scans"),
+    }
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+    EXPORT_INTERVAL = 15  # Seconds between two writes of the export files
+    ENDPOINT_ID_PATTERN = re.compile(r'/(by-hash/)?[0-9A-Fa-f]{8,}$|/\d+(?=/|$)')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> {'buckets', 'sum', 'count'}
+        self.events = deque(maxlen=200)
+        self.spans = deque(maxlen=2000)
+        self.local = threading.local()  # Stack of open spans per thread
+        self.directory = None
+        self.tracing = False
+        self.exporter = None
+        self.export_enabled = True
+
+    def disable_export(self):
+        # Short-lived and thin-client processes would overwrite the files of the process doing the work
+        self.export_enabled = False
+
+    def configure(self, directory, tracing=False):
+        self.directory = (directory or None) if self.export_enabled else None
+        self.tracing = tracing
+        if self.directory and self.exporter is None:
+            self.exporter = threading.Thread(target=self.export_loop, daemon=True)
+            self.exporter.start()
+            atexit.register(self.export)
+
+    @staticmethod
+    def label_key(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        key = (name, self.label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, self.label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(self.BUCKETS), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][i] += 1  # Cumulative, as in the Prometheus format
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def record_event(self, kind, **fields):
+        fields.update({'kind': kind, 'time': time.time()})
+        with self.lock:
+            self.events.append(fields)
+
+    @classmethod
+    def endpoint_label(cls, url):
+        # Collapse IDs and hashes so each endpoint is one label value
+        path = url.split('://', 1)[-1].split('?', 1)[0]
+        path = path[path.find('/'):] if '/' in path else '/'
+        return cls.ENDPOINT_ID_PATTERN.sub(lambda m: '/by-hash/{hash}' if m.group(1) else '/{id}', path)
+
+    def record_api_request(self, url, status, seconds):
+        endpoint = self.endpoint_label(url)
+        self.increment('civitai_api_requests_total', endpoint=endpoint, status=status)
+        self.observe('civitai_api_request_duration_seconds', seconds, endpoint=endpoint)
+
+    def record_cache_lookup(self, cache, hit):
+        self.increment('civitai_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+    def record_download(self, model_version_id, source, size, seconds):
+        self.increment('civitai_downloads_total', source=source, result='ok')
+        self.increment('civitai_download_bytes_total', size, source=source)
+        self.observe('civitai_download_duration_seconds', seconds, source=source)
+        self.record_event('download', version_id=model_version_id, source=source, bytes=size, seconds=round(seconds, 3),
+                          mb_per_second=round(size / 1024 / 1024 / seconds, 2) if seconds else None)
+
+    def record_hash(self, size, seconds):
+        self.increment('civitai_hash_bytes_total', size)
+        self.increment('civitai_hash_duration_seconds_total', seconds)
+
+    def record_scan(self, kind, files, seconds, hashed_bytes=0, hash_seconds=0.0):
+        self.increment('civitai_scan_files_total', files, kind=kind)
+        self.observe('civitai_scan_duration_seconds', seconds, kind=kind)
+        self.record_event('scan', scan=kind, files=files, seconds=round(seconds, 3),
+                          files_per_second=round(files / seconds, 1) if seconds else None,
+                          hash_mb_per_second=round(hashed_bytes / 1024 / 1024 / hash_seconds, 1) if hash_seconds else None)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        # Nested spans of one thread share a trace, e.g. the steps of one download
+        if not self.tracing:
+            yield None
+            return
+        stack = getattr(self.local, 'spans', None)
+        if stack is None:
+            stack = self.local.spans = []
+        parent = stack[-1] if stack else None
+        span = {
+            'trace_id': parent['trace_id'] if parent else os.urandom(8).hex(),
+            'span_id': os.urandom(8).hex(),
+            'parent_id': parent['span_id'] if parent else None,
+            'name': name,
+            'start': time.time(),
+            'attributes': attributes,
+        }
+        start = time.perf_counter()
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stack.pop()
+            span['duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+            with self.lock:
+                self.spans.append(span)
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ''
+        escaped = (key + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for key, value in labels)
+        return '{' + ','.join(escaped) + '}'
+
+    def to_prometheus(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: dict(value, buckets=list(value['buckets'])) for key, value in self.histograms.items()}
+        lines = []
+        for name, (kind, help_text) in self.DEFINITIONS.items():
+            series = sorted((labels, value) for (metric, labels), value in (counters if kind == 'counter' else histograms).items() if metric == name)
+            if not series:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, value in series:
+                if kind == 'counter':
+                    lines.append(f"{name}{self.format_labels(labels)} {value}")
+                    continue
+                for bound, count in zip(self.BUCKETS, value['buckets']):
+                    lines.append(f"{name}_bucket{self.format_labels(labels + (('le', str(bound)),))} {count}")
+                lines.append(f"{name}_bucket{self.format_labels(labels + (('le', '+Inf'),))} {value['count']}")
+                lines.append(f"{name}_sum{self.format_labels(labels)} {value['sum']}")
+                lines.append(f"{name}_count{self.format_labels(labels)} {value['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: dict(value) for key, value in self.histograms.items()}
+            events, spans = list(self.events), list(self.spans)
+        cache_lookups = {}
+        for (name, labels), value in counters.items():
+            if name == 'civitai_cache_requests_total':
+                labels = dict(labels)
+                cache_lookups.setdefault(labels['cache'], {'hit': 0, 'miss': 0})[labels['result']] += value
+        return {
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(counters.items())],
+            'histograms': [{'name': name, 'labels': dict(labels), 'count': value['count'], 'sum': value['sum'],
+                            'average': value['sum'] / value['count'] if value['count'] else None}
+                           for (name, labels), value in sorted(histograms.items())],
+            'cache_hit_ratio': {cache: lookups['hit'] / (lookups['hit'] + lookups['miss']) for cache, lookups in cache_lookups.items()},
+            'events': events,
+            'spans': spans,
+        }
+
+    def export(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for file_name, content in [('civitai_cli.prom', self.to_prometheus()), ('civitai_cli.json', json.dumps(self.to_json(), indent=4))]:
+            # The textfile collector must never see a half-written file
+            file_path = os.path.join(self.directory, file_name)
+            temp_path = f"{file_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as f:
+                f.write(content)
+            os.replace(temp_path, file_path)
+
+    def export_loop(self):
+        while True:
+            time.sleep(self.EXPORT_INTERVAL)
+            try:
+                self.export()
+            except OSError as e:
+                print(f"⚠️ Failed to export metrics to {self.directory}: {e}", file=sys.stderr)
+
+metrics = Metrics()
+
+class Profiler:
+    # Opt-in cProfile of whole actions, enabled with --profile DIR or CIVITAI_CLI_PROFILE=DIR.
+    # Methods are only wrapped when profiling is on, so a normal run pays nothing.
+    ACTIONS = {
+        'main_cli': ['list_models_menu', 'scan_for_missing_data_menu', 'failed_downloads_menu', '_scan_directory_for_models', 'hash_pending_models'],
+        'downloader': ['download_model_by_id', 'handle_model_download_by_id', 'deduplicate_models', 'scan_and_update_metadata', 'refresh_all_metadata'],
+    }
+    TOP_FUNCTIONS = 25  # Functions listed per action in the summary
+
+    def __init__(self, directory=None):
+        self.directory = None
+        self.lock = threading.Lock()
+        self.local = threading.local()  # Whether this thread is inside a profiled action
+        self.stats = {}  # action -> pstats.Stats over all of its runs
+        self.runs = {}  # action -> [number of runs, seconds]
+        self.sequence = 0
+        self.configure(directory)
+
+    def configure(self, directory):
+        if not directory or self.directory:
+            return
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        atexit.register(self.write_summary)
+
+    def instrument(self, main_cli):
+        if not self.directory:
+            return
+        for owner, names in [(main_cli, self.ACTIONS['main_cli']), (main_cli.downloader, self.ACTIONS['downloader'])]:
+            for name in names:
+                if name not in vars(owner):  # Already wrapped on this instance
+                    setattr(owner, name, self.wrap(getattr(owner, name), name.lstrip('_')))
+
+    def wrap(self, func, action):
+        if not self.directory:
+            return func
+
+        def profiled(*args, **kwargs):
+            return self.call(action, func, *args, **kwargs)
+        return profiled
+
+    def call(self, action, func, *args, **kwargs):
+        import cProfile
+        # Nested actions (a scan during a download) are part of the outer profile
+        if getattr(self.local, 'active', False):
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Another profiler is already running in this thread
+            return func(*args, **kwargs)
+        self.local.active = True
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            self.local.active = False
+            self.record(action, profile, time.perf_counter() - start)
+
+    def record(self, action, profile, seconds):
+        import pstats
+        with self.lock:
+            self.sequence += 1
+            file_name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.sequence:04d}-{action}.prof"
+            profile.dump_stats(os.path.join(self.directory, file_name))
+            if action in self.stats:
+                self.stats[action].add(profile)
+            else:
+                self.stats[action] = pstats.Stats(profile)
+            runs = self.runs.setdefault(action, [0, 0.0])
+            runs[0] += 1
+            runs[1] += seconds
+
+    def write_summary(self):
+        import pstats
+        with self.lock:
+            if not self.stats:
+                return
+            output = io.StringIO()
+            combined = pstats.Stats(stream=output)
+            for action, stats in sorted(self.stats.items(), key=lambda item: -self.runs[item[0]][1]):
+                count, seconds = self.runs[action]
+                output.write(f"==== {action}: {count} run(s), {seconds:.3f} s ====\n")
+                stats.stream = output
+                stats.sort_stats('cumulative').print_stats(self.TOP_FUNCTIONS)
+                combined.add(stats)
+            output.write("==== Hottest functions of all actions (own time) ====\n")
+            combined.sort_stats('tottime').print_stats(self.TOP_FUNCTIONS)
+            summary_path = os.path.join(self.directory, f"summary-{os.getpid()}.txt")
+            with open(summary_path, 'w') as f:
+                f.write(output.getvalue())
+        print(f"📈 Profiles written to {self.directory}, summary in {summary_path}", file=sys.stderr)
+
+profiler = Profiler(os.environ.get('CIVITAI_CLI_PROFILE'))
+
+class ModelIndex:
+    # index.json with a single writer: updates are queued and applied by one thread, readers get
+    # immutable snapshots, and a lock file serializes writers of different processes
+    def __init__(self, path='index.json'):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.updates = queue.Queue()
+        self.snapshot_lock = threading.Lock()
+        self.writer_thread = None
+        self.file_state = None  # (inode, size, mtime) of the file behind the current snapshot
+        self.current = types.MappingProxyType({})
+
+    def get_file_state(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def read_file(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            print(f"⚠️ {self.path} is corrupt, starting with an empty index.")
+            return {}
+
+    def snapshot(self):
+        # Picks up writes of other processes, the file is always replaced as a whole
+        file_state = self.get_file_state()
+        with self.snapshot_lock:
+            if file_state != self.file_state:
+                self.current = types.MappingProxyType(self.read_file())
+                self.file_state = file_state
+            return self.current
+
+    def update(self, mutate):
+        # mutate(index) edits a private copy of the index in the writer thread, the returned
+        # Future resolves with its return value once the change is on disk
+        future = Future()
+        self.updates.put((mutate, future))
+        with self.snapshot_lock:
+            if self.writer_thread is None:
+                self.writer_thread = threading.Thread(target=self.writer, daemon=True)
+                self.writer_thread.start()
+        return future
+
+    def writer(self):
+        while True:
+            batch = [self.updates.get()]
+            while True:  # Queued updates are written together
+                try:
+                    batch.append(self.updates.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.apply(batch)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def apply(self, batch):
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released when the file is closed
+            index = self.snapshot()
+            results = []
+            for mutate, future in batch:
+                # Each update edits its own copy, so a failing one leaves nothing half done behind
+                changed = {key: dict(entry) for key, entry in index.items()}
+                try:
+                    results.append((future, mutate(changed), None))
+                    index = changed
+                except Exception as e:
+                    results.append((future, None, e))
+            if index is not self.current:
+                temp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump(index, f, indent=4)
+                os.replace(temp_path, self.path)
+                with self.snapshot_lock:
+                    self.current = types.MappingProxyType(index)
+                    self.file_state = self.get_file_state()
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
 class MainCLI:
+    HASH_BATCH_FILES = 50  # Hashes written to the index at once...
+    HASH_BATCH_SECONDS = 10  # ...or after this long, whichever comes first
+
     def __init__(self, model_display, settings_cli, downloader):
         self.model_display = model_display
         self.settings_cli = settings_cli
         self.downloader = downloader
         self.selected_models_to_download = []
         self.BASE_MODELS = ["SDXL 1.0", "SDXL 0.9", "SD 1.5","SD 1.4", "SD 2.0", "SD 2.0 768", "SD 2.1", "SD 2.1 768", "Other"]
-        self.load_model_index()
+        self.index = ModelIndex()
+        self.hash_event = threading.Event()
+        self.hash_thread = None
+        self.scan_thread = None
+        self.quiet_scans = False  # Batch commands keep the terminal untouched
+        self.daemon_client = None
+
+    @property
+    def model_index(self):
+        # Read-only snapshot, loaded from index.json on first use
+        return self.load_model_index()
 
     def main_menu(self):
         # Clear the terminal
@@ -56,9 +560,13 @@ class MainCLI:
                      'Fetch model by ID',
                      'Download model by ID',
                      'Scan for missing data',
+                     'Download meta Data for existing models',
                      'Resume interrupted Downloads' if self.selected_models_to_download else 'No interrupted downloads',
                      'Fetch model version by ID',
                      'Fetch model by Hash',
+                     'Deduplicate models',
+                     'Sync from manifest',
+                     'Failed downloads',
                      'Settings',
                      'Exit'],
                  )
@@ -66,17 +574,59 @@ class MainCLI:
         return prompt(questions)['choice']
     
     def load_model_index(self):
-        try:
-            with open('index.json', 'r') as f:
-                self.model_index = json.load(f)
-        except FileNotFoundError:
-            self.model_index = {}
-        return self.model_index  # Ensure that a dictionary is always returned 
+        if self.daemon_client:
+            # The daemon owns the index, index.json is only read when it is gone
+            try:
+                return types.MappingProxyType(self.daemon_client.call('index'))
+            except (DaemonError, OSError) as e:
+                print(colored(f"⚠️ Reading the index from the daemon failed: {e}", "yellow"))
+        return self.index.snapshot()
+
+    def scan_directory_for_models(self, directory, quiet=None):
+        if self.daemon_client:
+            # The daemon scans and hashes, so the index has one writer across all clients
+            try:
+                return self.daemon_client.call('scan', {'directory': os.path.abspath(directory)})
+            except (DaemonError, OSError) as e:
+                print(colored(f"🚫 Scanning through the daemon failed: {e}", "red"))
+                return False
+        quiet = self.quiet_scans if quiet is None else quiet
+        # Walk and read the files on a copy, outside the writer and its file lock
+        snapshot = self.index.snapshot()
+        model_hashes = {key: dict(entry) for key, entry in snapshot.items()}
+        new_files_found = self._scan_directory_for_models(directory, quiet, model_hashes)
+        added = {key: entry for key, entry in model_hashes.items() if snapshot.get(key) != entry}
+        deleted = [key for key in snapshot if key not in model_hashes]
+
+        def apply_scan(index):
+            # Entries changed by someone else since the snapshot are newer than the scan
+            for key, entry in added.items():
+                if index.get(key) == snapshot.get(key):
+                    index[key] = entry
+            for key in deleted:
+                if index.get(key) == snapshot[key]:
+                    del index[key]
+        if added or deleted:
+            self.index.update(apply_scan).result()
+        self.hash_event.set()  # Hash newly identified files once the CLI is idle
+        return new_files_found
+
+    def start_background_scan(self, directory):
+        # Reconcile the index with the disk without holding up the first menu
+        def scan():
+            self.scan_directory_for_models(directory, quiet=True)
+            log_startup_phase("background scan finished")
 
-    def scan_directory_for_models(self, directory):
-        print("Scanning directory for downloaded models...")
-        model_hashes = self.load_model_index()  # Load the existing index
+        if self.scan_thread is None or not self.scan_thread.is_alive():
+            self.scan_thread = threading.Thread(target=scan, daemon=True)
+            self.scan_thread.start()
+
+    def _scan_directory_for_models(self, directory, quiet, model_hashes):
+        if not quiet:
+            print("Scanning directory for downloaded models...")
         new_files_found = False
+        scan_start = time.perf_counter()
+        files_scanned = 0
         directories_to_scan = [
             "models/Stable-diffusion",
             "embeddings",
@@ -100,6 +650,7 @@ class MainCLI:
                         _, ext = os.path.splitext(file)
                         if ext.lower() not in ['.ckpt', '.pt', '.safetensors']:
                             continue  # Skip this file if it doesn't have one of the desired extensions
+                        files_scanned += 1
                         model_id, _ = os.path.splitext(file)
                         model_file_path = os.path.join(root, file)  # Define model_file_path here
                         if any(model.get('filepath') == model_file_path and model.get('modelversionid') == model_id for model in model_hashes.values()):
@@ -122,7 +673,8 @@ class MainCLI:
                                 model_id = info.get('id')
                                 model_modelId = info.get('modelId')
                                 model_name = info.get('model', {}).get('name')
-                                print(f"Fetching hash from civitai.info for model {model_name}")
+                                if not quiet:
+                                    print(f"Fetching hash from civitai.info for model {model_name}")
                                 model_hashes[model_key] = {"modelname": model_name, "modelid": model_modelId, "modelversionid": model_id, "hash": model_hash, "filepath": model_file_path}
                         else:
                             for model in model_hashes.values():
@@ -133,23 +685,126 @@ class MainCLI:
                                 with open(model_file_path, 'rb') as f:
                                     model_data = f.read()
                                     model_hash = hashlib.sha256(model_data).hexdigest()
-                                print(f"Generating hash for model {model_id}")
+                                if not quiet:
+                                    print(f"Generating hash for model {model_id}")
                                 model_hashes[model_key] = {"modelname": model_name, "modelid": model_modelId, "modelversionid": model_id, "hash": model_hash, "filepath": model_file_path}
+                            if ext.lower() == '.safetensors' and not model_hashes[model_key].get('hash'):
+                                self.identify_model_file(model_hashes[model_key], dir_to_scan, quiet)
                 for model_id in list(model_hashes.keys()):  # We use list() to avoid modifying the dictionary while iterating
                     model = model_hashes[model_id]
                     model_file_path = model.get('filepath')
                     if model_file_path and not os.path.exists(model_file_path):
                         del model_hashes[model_id]
-        with open('index.json', 'w') as f:
-            json.dump(model_hashes, f, indent=4)
-        print("Finished scanning.")
-        os.system('cls' if os.name == 'nt' else 'clear')
+        metrics.record_scan('directory', files_scanned, time.perf_counter() - scan_start)
+        if not quiet:
+            print("Finished scanning.")
+            os.system('cls' if os.name == 'nt' else 'clear')
         return new_files_found
 
 
+    def identify_model_file(self, model_entry, dir_to_scan, quiet=False):
+        # Index unknown safetensors files right away from their header, the full hash follows later
+        try:
+            header_info = SafetensorsIdentifier.identify(model_entry['filepath'])
+        except (OSError, ValueError) as e:
+            if not quiet:
+                print(f"Could not read safetensors header of {model_entry['filepath']}: {e}")
+            return
+        model_entry.update({"type": header_info['type'], "safetensors": header_info, "hash_pending": True})
+        expected_dir = self.downloader.type_to_path.get(header_info['type'])
+        if expected_dir and expected_dir != dir_to_scan and header_info['type'] != 'Other' and not quiet:
+            print(f"{os.path.basename(model_entry['filepath'])} looks like a {header_info['type']}, which belongs in {expected_dir}")
+
+    def hash_pending_models(self):
+        pending = [(key, model.get('filepath')) for key, model in self.model_index.items() if model.get('hash_pending')]
+        hashes = []
+        last_write = time.monotonic()
+        for key, file_path in pending:
+            # Only hash while no download is running, whatever its size or backend
+            while self.downloader.active_download_count():
+                time.sleep(5)
+            try:
+                hashes.append((key, file_path, self.downloader.generate_sha256(file_path)))
+            except OSError:
+                continue
+            # Write in chunks, so an interrupted pass keeps what it finished
+            if len(hashes) >= self.HASH_BATCH_FILES or time.monotonic() - last_write >= self.HASH_BATCH_SECONDS:
+                self.store_hashes(hashes)
+                hashes = []
+                last_write = time.monotonic()
+        self.store_hashes(hashes)
+
+    def store_hashes(self, hashes):
+        if not hashes:
+            return
+
+        def set_hashes(model_hashes):
+            for key, file_path, file_hash in hashes:
+                model = model_hashes.get(key)
+                if model is not None and model.get('filepath') == file_path:
+                    model['hash'] = file_hash
+                    model.pop('hash_pending', None)
+        self.index.update(set_hashes).result()
+
+    def hash_worker(self):
+        while True:
+            self.hash_event.wait()
+            self.hash_event.clear()
+            self.hash_pending_models()
+
+    def start_hash_worker(self):
+        if self.hash_thread is None:
+            self.hash_thread = threading.Thread(target=self.hash_worker, daemon=True)
+            self.hash_thread.start()
+
+    def schedule_selected_downloads(self):
+        jobs = [{'model_id': model_id, 'version_id': version_id} for model_id, version_id in self.selected_models_to_download]
+        return self.downloader.schedule_downloads(jobs)
+
+    def add_archive_to_index(self, model_version_id, archive_name, extracted_files, archive_hash, model_version_details=None):
+        model_version_details = model_version_details or {}
+        entry = {
+            "modelname": model_version_details.get('model', {}).get('name'),
+            "modelid": model_version_details.get('modelId'),
+            "modelversionid": model_version_id,
+            "hash": None,
+            "archive_hash": archive_hash,
+            "filepath": extracted_files[0] if extracted_files else None,
+            "extracted_files": extracted_files
+        }
+        self.index.update(lambda model_hashes: model_hashes.__setitem__(f"{model_version_id}_{archive_name}", entry)).result()
+
     def download_in_background(self):
-        for model_id, version_id in self.selected_models_to_download:
-            self.downloader.handle_multi_model_download_by_id(model_id, version_id, silent=True)
+        if self.daemon_client:
+            # The daemon schedules downloads of every client in one queue
+            selected_models = self.selected_models_to_download
+            self.selected_models_to_download = []
+            job_client = self.daemon_client.open_connection()
+            if job_client is None:
+                print(colored("🚫 The daemon is no longer running. Use 'Resume interrupted Downloads' to try again.", "red"))
+                self.selected_models_to_download = selected_models
+                return
+            try:
+                job_client.run({'command': 'download', 'ids': [str(version_id) for _, version_id in selected_models]}, on_record=lambda record: None)
+            except (DaemonError, OSError) as e:
+                print(colored(f"🚫 Downloading through the daemon failed: {e}", "red"))
+            finally:
+                job_client.close()
+            return
+        jobs = self.schedule_selected_downloads()
+        if self.settings_cli.download_backend == 'rpc':
+            # Submit everything at once and let the aria2c daemon multiplex the transfers
+            download_threads = [
+                threading.Thread(target=self.downloader.handle_multi_model_download_by_id, args=(job['model_id'], job['version_id']), kwargs={'silent': True})
+                for job in jobs
+            ]
+            for download_thread in download_threads:
+                download_thread.start()
+            for download_thread in download_threads:
+                download_thread.join()
+        else:
+            for job in jobs:
+                self.downloader.handle_multi_model_download_by_id(job['model_id'], job['version_id'], silent=True)
         self.selected_models_to_download = []  # Clear the list
 
     def fetch_model_by_id(self):
@@ -183,13 +838,18 @@ class MainCLI:
                     return
                 total_pages = metadata.get('totalPages', 1)  # Initialize total pages
 
+                # Fetch all card images of the page concurrently, the cards are still printed in order
+                self.model_display.prefetch_images(models, self.settings_cli.image_filter_settings)
+
                 # Display the fetched models
+                page_output = []
+                model_index = self.model_index  # One read for the whole page, it may come from the daemon
                 for model in models:
                     model_id = model.get('id')
                     #print(f"DEBUG: Checking model with ID: {model_id}")  # Debug statement
                     downloaded_versions = []  # List to store downloaded versions
                     model_versions = model.get('modelVersions', [])
-                    for index_model in self.model_index.values():
+                    for index_model in model_index.values():
                         if index_model['modelid'] == model_id:
                             for version in model_versions:
                                 if index_model['modelversionid'] == version.get('id'):
@@ -210,7 +870,8 @@ class MainCLI:
                                 download_status = f"{Fore.GREEN}✅ ALL VERSIONS DOWNLOADED. Version '{', '.join(downloaded_versions)}' is downloaded.{Style.RESET_ALL}"
                             else:
                                 download_status = f"{Fore.GREEN}✅ ALL VERSIONS DOWNLOADED. Versions '{', '.join(downloaded_versions)}' are downloaded.{Style.RESET_ALL}"
-                    self.model_display.display_model_card(model, self.settings_cli.image_filter, download_status, self.settings_cli.image_filter_settings)
+                    page_output.append(self.model_display.render_model_card(model, self.settings_cli.image_filter, download_status, self.settings_cli.image_filter_settings))
+                self.model_display.write_output(''.join(page_output))
                 reload_page = False
                 
 
@@ -290,10 +951,13 @@ class MainCLI:
                     return
                 # Update total pages based on the metadata received from the search query
                 total_pages = metadata.get('totalPages', 1)  # <-- Add this line
+                self.model_display.prefetch_images(models, self.settings_cli.image_filter_settings)
                 # Display the fetched models
-                for model in models: 
-                    # Access image_filter from settings_cli and pass it to display_model_card
-                    self.model_display.display_model_card(model, self.settings_cli.image_filter, download_status, self.settings_cli.image_filter_settings)
+                page_output = []
+                for model in models:
+                    # Access image_filter from settings_cli and pass it to render_model_card
+                    page_output.append(self.model_display.render_model_card(model, self.settings_cli.image_filter, download_status, self.settings_cli.image_filter_settings))
+                self.model_display.write_output(''.join(page_output))
                     # Debug: Print image_filter value
                     #print(f"DEBUG: Current image_filter = {self.settings_cli.image_filter}")
 
@@ -317,13 +981,14 @@ class MainCLI:
                 if 'Back' in selected_model_ids:
                     continue  # Continue to the next iteration of the outer loop if 'Back' is selected
                 if selected_model_ids:
+                    model_index = self.model_index
                     for model_id in selected_model_ids:
                         model = self.settings_cli.api_handler.get_model_by_id(model_id)
                         model_versions = model.get('modelVersions', [])
                         
                         # Fetch downloaded versions for the current model
                         downloaded_versions = []  # List to store downloaded versions
-                        for index_model in self.model_index.values():
+                        for index_model in model_index.values():
                             if index_model['modelid'] == model_id:
                                 for version in model_versions:
                                     if index_model['modelversionid'] == version.get('id'):
@@ -377,8 +1042,8 @@ class MainCLI:
             elif action == 'Initiate Download':
                 reload_page = False
                 if self.selected_models_to_download:
-                    for model_id, version_id in self.selected_models_to_download:
-                        self.downloader.handle_multi_model_download_by_id(model_id, version_id, silent=False)
+                    for job in self.schedule_selected_downloads():
+                        self.downloader.handle_multi_model_download_by_id(job['model_id'], job['version_id'], silent=False)
                     self.selected_models_to_download = []  # Clear the list after downloading
                     print("All selected models have been downloaded.")
                 else:
@@ -429,7 +1094,63 @@ class MainCLI:
                      'Overwrite all'],
                  )
         ]
-        return prompt(questions)['choice']
+        choice = prompt(questions)['choice']
+        if choice == 'Overwrite all':
+            self.downloader.refresh_all_metadata()
+        elif choice == 'For specific model':
+            answer = prompt([Text('model', message="Enter the file name, model ID or SHA-256 of the model:")])['model'].strip()
+            if not answer:
+                return choice
+            keys = [
+                key for key, model in self.load_model_index().items()
+                if answer in (os.path.basename(model.get('filepath') or ''), str(model.get('modelid')))
+                or (model.get('hash') or '').lower() == answer.lower()
+            ]
+            if keys:
+                self.downloader.refresh_all_metadata(keys=keys)
+            else:
+                print(colored(f"🚫 No indexed model matches {answer}.", "red"))
+        return choice
+
+    def sync_manifest_menu(self):
+        questions = [
+            Text('manifest_path',
+                 message="Enter the manifest path:",
+                 default=ModelSync.DEFAULT_MANIFEST)
+        ]
+        return prompt(questions)['manifest_path']
+
+    def failed_downloads_menu(self):
+        failed_downloads = list(self.downloader.failed_downloads_list)
+        if not failed_downloads:
+            print(colored("✅ No failed downloads.", "green"))
+            return
+
+        print(colored(f"⚠️ {len(failed_downloads)} failed downloads:", "yellow"))
+        for entry in failed_downloads:
+            if entry['attempts'] >= FailedDownloadQueue.MAX_ATTEMPTS:
+                next_retry = "gave up"
+            elif entry.get('terminal'):
+                next_retry = "not retried automatically"
+            else:
+                next_retry = f"next retry in {max(int(entry['next_attempt_at'] - time.time()), 0)}s"
+            target = f"version {entry['version_id']}" if entry.get('version_id') is not None else f"model {entry['model_id']}"
+            print(f"  {target} ({entry['type']}): {entry['error_class']} after {entry['attempts']} attempts, {next_retry}")
+            if entry.get('error'):
+                print(f"      {entry['error']}")
+
+        questions = [
+            List('choice',
+                 message="What would you like to do?",
+                 choices=['Retry all now', 'Clear list', 'Back to main menu'],
+                 )
+        ]
+        choice = prompt(questions)['choice']
+        if choice == 'Retry all now':
+            self.downloader.retry_failed_downloads(force=True)
+        elif choice == 'Clear list':
+            self.downloader.failed_downloads_list.clear()
+            print("Cleared the failed downloads list.")
 
     def fetch_model_version_by_id(self):
         questions = [
@@ -525,16 +1246,36 @@ class SettingsCLI:
                 settings = json.load(f)
             self.model_display.text_only = settings.get('text_only', False)
             self.model_display.size = settings.get('size', 'medium')
+            self.model_display.use_pager = settings.get('use_pager', False)
             self.image_filter = settings.get('image_filter', {'Soft': 'allow', 'Mature': 'block', 'X': 'blockify'})
             if not self.validate_image_filter(self.image_filter):
                 print("Warning: Invalid image filter settings found. Using default settings.")
                 self.image_filter = {'Soft': 'blockify', 'Mature': 'block', 'X': 'block'}
             #print(f"DEBUG: Loaded image_filter = {self.image_filter}")  # Debug print
             self.root_directory = settings.get('root_directory', os.path.join(os.path.expanduser("~"), 'Downloads'))
+            self.download_backend = settings.get('download_backend', 'process')
+            self.cache_location = settings.get('cache_location', '')
+            self.download_order = settings.get('download_order', 'fifo')
+            self.file_preferences = settings.get('file_preferences', {})
+            self.extract_archives = settings.get('extract_archives', False)
+            self.bandwidth = settings.get('bandwidth', {'limit_mbps': 0, 'windows': []})
+            self.preview_max_size = settings.get('preview_max_size', 512)
+            self.metrics_directory = settings.get('metrics_directory', '')
+            self.tracing = settings.get('tracing', False)
         except FileNotFoundError:
             print("Settings file not found. Using default settings.")
             self.image_filter = {'Soft': 'blockify', 'Mature': 'block', 'X': 'block'}
             self.root_directory = os.path.join(os.path.expanduser("~"), 'Downloads')
+            self.download_backend = 'process'
+            self.cache_location = ''
+            self.download_order = 'fifo'
+            self.file_preferences = {}
+            self.extract_archives = False
+            self.bandwidth = {'limit_mbps': 0, 'windows': []}
+            self.preview_max_size = 512
+            self.metrics_directory = ''
+            self.tracing = False
+        metrics.configure(self.metrics_directory, self.tracing)
 
     def settings_menu(self):
         while True:
@@ -544,9 +1285,18 @@ class SettingsCLI:
                      choices=[
                          'Change display mode',
                          'Adjust image size',
+                         'Set paging',
                          'Set default query',
                          'Set image filter',
                          'Set root directory',
+                         'Set download backend',
+                         'Set LAN cache',
+                         'Set download order',
+                         'Set file preferences',
+                         'Set archive extraction',
+                         'Set bandwidth limit',
+                         'Set preview size',
+                         'Set metrics export',
                          'Back to main menu'],
                      )
             ]
@@ -555,9 +1305,18 @@ class SettingsCLI:
             action_map = {
                 'Change display mode': self.change_display_mode,
                 'Adjust image size': self.adjust_image_size,
+                'Set paging': self.set_paging,
                 'Set default query': self.set_default_query,
                 'Set image filter': self.set_image_filter,
                 'Set root directory': self.set_root_directory,
+                'Set download backend': self.set_download_backend,
+                'Set LAN cache': self.set_cache_location,
+                'Set download order': self.set_download_order,
+                'Set file preferences': self.set_file_preferences,
+                'Set archive extraction': self.set_archive_extraction,
+                'Set bandwidth limit': self.set_bandwidth_limit,
+                'Set preview size': self.set_preview_size,
+                'Set metrics export': self.set_metrics_export,
                 'Back to main menu': self.exit_menu,
             }
             
@@ -703,6 +1462,127 @@ class SettingsCLI:
             main_cli.scan_directory_for_models(self.root_directory)
             print("Model index updated.")
 
+    def set_download_backend(self):
+        questions = [
+            List('choice',
+                 message=f"Choose download backend (Current: {self.download_backend}):",
+                 choices=[
+                     ('One aria2c process per file', 'process'),
+                     ('Shared aria2c RPC daemon', 'rpc')],
+                 )
+        ]
+        self.download_backend = prompt(questions)['choice']
+        self.save_settings()
+        print(f"Download backend changed to {self.download_backend}.")
+
+    def set_cache_location(self):
+        questions = [
+            Text('cache_location', message=f'Enter a shared cache directory or mirror URL (Current: {self.cache_location or "Not Set"}, press space to clear):')
+        ]
+        answer = prompt(questions)['cache_location']
+        if answer == " ":
+            self.cache_location = ''
+        elif answer:
+            self.cache_location = answer
+        self.save_settings()
+        print(f"LAN cache set to {self.cache_location or 'Not Set'}.")
+
+    def set_download_order(self):
+        questions = [
+            List('choice',
+                 message=f"Choose the order for queued downloads (Current: {self.download_order}):",
+                 choices=[
+                     ('In selection order', 'fifo'),
+                     ('Smallest first', 'smallest-first'),
+                     ('Largest first', 'largest-first')],
+                 )
+        ]
+        self.download_order = prompt(questions)['choice']
+        self.save_settings()
+        print(f"Download order changed to {self.download_order}.")
+
+    def set_file_preferences(self):
+        file_preferences = {}
+        print(f"Current file preferences: {self.file_preferences or 'None (default file of each version)'}")
+        for key, choices, description in [("format", ["SafeTensor", "PickleTensor"], "file format"), ("fp", ["fp16", "fp32"], "precision"), ("size", ["pruned", "full"], "model size")]:
+            question = List(key, message=f'Which {description} do you prefer?', choices=['Any'] + choices, default=self.file_preferences.get(key, 'Any'))
+            ans = prompt([question])[key]
+            if ans != 'Any':
+                file_preferences[key] = ans
+
+        max_size_question = Text('max_size_mb', message=f'Maximum file size in MB? (Current: {self.file_preferences.get("max_size_mb", "Not Set")}, leave empty for no limit)')
+        max_size_ans = prompt([max_size_question])['max_size_mb']
+        if max_size_ans:
+            if not max_size_ans.isdigit() or int(max_size_ans) == 0:
+                print("Invalid size. Please enter a number of MB. File preferences were not changed.")
+                return
+            file_preferences['max_size_mb'] = int(max_size_ans)
+
+        skip_pickle_question = Confirm('skip_pickle', message='Skip pickle (.ckpt/.pt) files entirely?', default=self.file_preferences.get('skip_pickle', False))
+        if prompt([skip_pickle_question])['skip_pickle']:
+            file_preferences['skip_pickle'] = True
+
+        self.file_preferences = file_preferences
+        self.save_settings()
+        print(f"File preferences changed to {self.file_preferences or 'None'}.")
+
+    def set_archive_extraction(self):
+        question = Confirm('extract_archives', message='Extract downloaded Wildcards, Poses and Workflows archives into their folder?', default=self.extract_archives)
+        self.extract_archives = prompt([question])['extract_archives']
+        self.save_settings()
+        print(f"Archive extraction {'enabled' if self.extract_archives else 'disabled'}.")
+
+    def set_bandwidth_limit(self):
+        bandwidth = dict(self.bandwidth)
+        limit_question = Text('limit_mbps', message=f'Download limit in MB/s shared by all downloads? (Current: {bandwidth.get("limit_mbps") or "Unlimited"}, 0 for unlimited)')
+        limit_ans = prompt([limit_question])['limit_mbps']
+        if limit_ans:
+            if re.fullmatch(r'\s*\d+(\.\d+)?\s*', limit_ans):
+                bandwidth['limit_mbps'] = float(limit_ans)
+            else:
+                print("Invalid limit. Please enter a number of MB/s.")
+
+        current_windows = ', '.join(f"{w['start']}-{w['end']}" for w in bandwidth.get('windows', [])) or "Not Set"
+        window_question = Text('window', message=f'Full speed time window, e.g. 01:00-06:00? (Current: {current_windows}, press space to clear)')
+        window_ans = prompt([window_question])['window']
+        if window_ans == " ":
+            bandwidth['windows'] = []
+        elif window_ans:
+            match = re.fullmatch(r'\s*(\d{2}:\d{2})\s*-\s*(\d{2}:\d{2})\s*', window_ans)
+            if match:
+                bandwidth['windows'] = [{'start': match.group(1), 'end': match.group(2), 'limit_mbps': 0}]
+            else:
+                print("Invalid time window. Please use the HH:MM-HH:MM format.")
+
+        self.bandwidth = bandwidth
+        self.save_settings()
+        print("Bandwidth limit changed. Running downloads pick it up automatically.")
+
+    def set_preview_size(self):
+        question = Text('preview_max_size', message=f'Maximum width/height of .preview.png images in pixels? (Current: {self.preview_max_size or "Original"}, 0 keeps the original size)')
+        answer = prompt([question])['preview_max_size']
+        if answer:
+            if answer.isdigit():
+                self.preview_max_size = int(answer)
+                self.save_settings()
+                print(f"Preview size set to {self.preview_max_size or 'original'}.")
+            else:
+                print("Invalid size. Please enter a number of pixels.")
+
+    def set_metrics_export(self):
+        question = Text('metrics_directory', message=f'Directory for civitai_cli.prom and civitai_cli.json? (Current: {self.metrics_directory or "Not Set"}, press space to disable)')
+        answer = prompt([question])['metrics_directory']
+        if answer == " ":
+            self.metrics_directory = ''
+        elif answer:
+            self.metrics_directory = os.path.abspath(os.path.expanduser(answer))
+        if self.metrics_directory:
+            tracing_question = Confirm('tracing', message='Record a trace of every download?', default=self.tracing)
+            self.tracing = prompt([tracing_question])['tracing']
+        metrics.configure(self.metrics_directory, self.tracing)
+        self.save_settings()
+        print(f"Metrics export {'to ' + self.metrics_directory if self.metrics_directory else 'disabled'}.")
+
     def change_display_mode(self):
         questions = [
             List('choice',
@@ -727,13 +1607,29 @@ class SettingsCLI:
         self.save_settings()
         print(f"Image size changed to {choice}.")
     
+    def set_paging(self):
+        question = Confirm('use_pager', message='Page long listings through less?', default=self.model_display.use_pager)
+        self.model_display.use_pager = prompt([question])['use_pager']
+        self.save_settings()
+        print(f"Paging {'enabled' if self.model_display.use_pager else 'disabled'}.")
+
     def save_settings(self):
         settings = {
             'text_only': self.model_display.text_only,
             'size': self.model_display.size,
+            'use_pager': self.model_display.use_pager,
             #'model_version_preference': self.model_version_preference,  
             'root_directory': self.root_directory,
-            'image_filter': self.image_filter
+            'image_filter': self.image_filter,
+            'download_backend': self.download_backend,
+            'cache_location': self.cache_location,
+            'download_order': self.download_order,
+            'file_preferences': self.file_preferences,
+            'extract_archives': self.extract_archives,
+            'bandwidth': self.bandwidth,
+            'preview_max_size': self.preview_max_size,
+            'metrics_directory': self.metrics_directory,
+            'tracing': self.tracing
         }
         with open('settings.json', 'w') as f:
             json.dump(settings, f)
@@ -759,6 +1655,36 @@ class SettingsCLI:
 class APIHandler:
     BASE_URL = 'https://civitai.com/api/v1/'
 
+    def __init__(self, cache_ttl=0):
+        self.cache_ttl = cache_ttl  # Seconds to keep model/version/hash lookups, 0 disables the cache
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+        self._session = None
+
+    @property
+    def session(self):
+        # One pooled session, created on first use so startup does not import requests
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+
+    def get_json(self, endpoint):
+        if self.cache_ttl:
+            with self.cache_lock:
+                cached = self.cache.get(endpoint)
+            hit = bool(cached and time.monotonic() - cached[0] < self.cache_ttl)
+            metrics.record_cache_lookup('api', hit)
+            if hit:
+                return cached[1]
+        start = time.perf_counter()
+        response = self.session.get(endpoint, allow_redirects=False)
+        metrics.record_api_request(endpoint, response.status_code, time.perf_counter() - start)
+        result = response.json() if response.status_code == 200 else None
+        if self.cache_ttl and result is not None:
+            with self.cache_lock:
+                self.cache[endpoint] = (time.monotonic(), result)
+        return result
+
     def preprocess_query(self, query_dict):
         for key, value in query_dict.items():
             if isinstance(value, bool):
@@ -843,7 +1769,9 @@ class APIHandler:
         retry_count = 0  # Initialize retry count
 
         while retry_count < max_retries:
-            response = requests.get(endpoint, params=query_dict, headers=headers, allow_redirects=False)
+            start = time.perf_counter()
+            response = self.session.get(endpoint, params=query_dict, headers=headers, allow_redirects=False)
+            metrics.record_api_request(endpoint, response.status_code, time.perf_counter() - start)
             #print("Status Code:", response.status_code)
 
             if response.status_code == 200:
@@ -859,6 +1787,7 @@ class APIHandler:
 
             elif 500 <= response.status_code < 600:
                 print(f"Server error occurred. Retrying... {retry_count + 1}/{max_retries}")
+                metrics.increment('civitai_api_retries_total', endpoint=Metrics.endpoint_label(endpoint))
                 retry_count += 1
                 time.sleep(2)  # Wait for 2 seconds before retrying
 
@@ -869,29 +1798,517 @@ class APIHandler:
 
     def get_model_by_id(self, model_id):
         endpoint = f"{self.BASE_URL}models/{model_id}"
-        response = requests.get(endpoint, allow_redirects=False)
-        #print("Status Code:", response.status_code)
-        return response.json() if response.status_code == 200 else None
+        return self.get_json(endpoint)
 
     def get_model_version_by_id(self, version_id):
         endpoint = f"{self.BASE_URL}model-versions/{version_id}"
-        response = requests.get(endpoint, allow_redirects=False)
-        #print("Status Code:", response.status_code)
-        return response.json() if response.status_code == 200 else None
+        return self.get_json(endpoint)
 
     def get_model_by_hash(self, hash_value):
         endpoint = f"{self.BASE_URL}model-versions/by-hash/{hash_value}"
-        response = requests.get(endpoint, allow_redirects=False)
-        #print("Status Code:", response.status_code)
-        return response.json() if response.status_code == 200 else None  
+        return self.get_json(endpoint)
+
+class RateLimiter:
+    # Spaces out calls from any number of threads to at most `rate` per second
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class BandwidthLimiter:
+    # Token bucket on bytes shared by every download of this process. The limit is
+    # read from the settings on each call, so changes apply to running downloads.
+    def __init__(self, settings_cli):
+        self.settings_cli = settings_cli
+        self.lock = threading.Lock()
+        self.tokens = 0.0
+        self.last_refill = time.monotonic()
+
+    def current_limit(self, now=None):
+        # Bytes per second, 0 means unlimited
+        bandwidth = self.settings_cli.bandwidth
+        current_time = (now or datetime.now()).strftime('%H:%M')
+        for window in bandwidth.get('windows', []):
+            start, end = window['start'], window['end']
+            if start <= end:
+                in_window = start <= current_time < end
+            else:  # Window wraps around midnight
+                in_window = current_time >= start or current_time < end
+            if in_window:
+                return int(window.get('limit_mbps', 0) * 1024 * 1024)
+        return int(bandwidth.get('limit_mbps', 0) * 1024 * 1024)
+
+    def consume(self, size):
+        limit = self.current_limit()
+        if not limit:
+            return
+        with self.lock:
+            now = time.monotonic()
+            # Allow a burst of at most one second worth of bytes
+            self.tokens = min(self.tokens + (now - self.last_refill) * limit, limit)
+            self.last_refill = now
+            self.tokens -= size
+            wait = -self.tokens / limit if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+class Aria2RPCError(Exception):
+    pass
+
+class Aria2RPCClient:
+    def __init__(self, host='localhost', port=6800, secret=None, bandwidth_limiter=None, download_limit=None):
+        self.host = host
+        self.port = port
+        self.url = f"http://{host}:{port}/jsonrpc"
+        self.secret = secret if secret is not None else os.environ.get('ARIA2_RPC_SECRET')
+        self.process = None  # Only set if we launched the daemon ourselves
+        # Bytes per second this daemon may use, the whole shared budget unless told otherwise
+        self.download_limit = download_limit or (bandwidth_limiter.current_limit if bandwidth_limiter else None)
+        self.applied_limit = None
+        self.request_id = 0
+        self.lock = threading.Lock()
+
+    def call(self, method, *params):
+        with self.lock:
+            self.request_id += 1
+            request_id = self.request_id
+        if self.secret:
+            params = (f"token:{self.secret}",) + params
+        payload = {'jsonrpc': '2.0', 'id': str(request_id), 'method': f"aria2.{method}", 'params': list(params)}
+        response = requests.post(self.url, json=payload, timeout=10)
+        try:
+            result = response.json()
+        except ValueError:
+            raise Aria2RPCError(f"Invalid response from aria2 RPC: {response.text[:200]}")
+        if 'error' in result:
+            raise Aria2RPCError(result['error'].get('message', 'Unknown aria2 RPC error'))
+        return result.get('result')
+
+    def is_running(self):
+        try:
+            self.call('getVersion')
+            return True
+        except (requests.exceptions.RequestException, Aria2RPCError):
+            return False
+
+    def ensure_running(self):
+        # Attach to an existing daemon if one is listening, otherwise launch one
+        if self.is_running():
+            return
+        aria2_command = [
+            "aria2c",
+            "--enable-rpc",
+            "--rpc-listen-port", str(self.port),
+            "--max-concurrent-downloads", "5",
+            "--continue=true"
+        ]
+        if self.secret:
+            aria2_command.append(f"--rpc-secret={self.secret}")
+        self.process = Popen(aria2_command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(50):
+            if self.is_running():
+                return
+            if self.process.poll() is not None:
+                break  # Exited, e.g. because the port was taken
+            time.sleep(0.1)
+        self.process.terminate()
+        self.process = None
+        raise Aria2RPCError(f"aria2c RPC daemon did not start on port {self.port}")
+
+    def add_uri(self, url, directory):
+        return self.call('addUri', [url], {'dir': directory, 'content-disposition-default-utf8': 'true'})
+
+    def tell_status(self, gid):
+        return self.call('tellStatus', gid, ['gid', 'status', 'errorMessage', 'totalLength', 'completedLength', 'downloadSpeed'])
+
+    @staticmethod
+    def free_port():
+        # Same address as the RPC URL, 'localhost' may resolve to ::1
+        with socket.socket(socket.AF_INET) as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def sync_download_limit(self):
+        # The daemon enforces one overall limit across all of its downloads
+        if self.download_limit is None:
+            return
+        limit = self.download_limit()
+        if limit != self.applied_limit:
+            self.call('changeGlobalOption', {'max-overall-download-limit': str(limit)})
+            self.applied_limit = limit
+
+    def tell_active(self):
+        return self.call('tellActive', ['gid', 'totalLength', 'completedLength', 'downloadSpeed'])
+
+    @staticmethod
+    def format_eta(seconds):
+        if seconds is None:
+            return "--:--"
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+    def wait_for_download(self, gid, silent=False, poll_interval=0.5):
+        while True:
+            self.sync_download_limit()
+            status = self.tell_status(gid)
+            if status['status'] == 'complete':
+                if not silent:
+                    print()
+                return status
+            if status['status'] in ('error', 'removed'):
+                raise Aria2RPCError(status.get('errorMessage') or f"Download {gid} was {status['status']}")
+
+            if not silent:
+                active_downloads = self.tell_active()
+                total_speed = sum(int(download['downloadSpeed']) for download in active_downloads)
+                completed = int(status['completedLength'])
+                total = int(status['totalLength'])
+                speed = int(status['downloadSpeed'])
+                percent = completed * 100 / total if total else 0
+                eta = (total - completed) / speed if speed else None
+                print(f"   Downloading... {percent:5.1f}% {speed / 1e6:7.2f} MB/s ETA {self.format_eta(eta)} "
+                      f"({len(active_downloads)} active, {total_speed / 1e6:.2f} MB/s total)", end="\r", flush=True)
+            time.sleep(poll_interval)
+
+    def shutdown(self):
+        if self.process is None:
+            return
+        try:
+            self.call('shutdown')
+        except (requests.exceptions.RequestException, Aria2RPCError):
+            self.process.terminate()
+        self.process.wait()
+        self.process = None
+
+class ModelCache:
+    # Layout: <location>/<version_id>/manifest.json plus the model file next to it.
+    # The location is either a shared directory or the base URL of an HTTP mirror.
+    CHUNK_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, location, bandwidth_limiter=None):
+        self.location = location.rstrip('/')
+        self.bandwidth_limiter = bandwidth_limiter
+        self.is_remote = self.location.startswith(('http://', 'https://'))
+
+    def _entry(self, model_version_id, name):
+        if self.is_remote:
+            return f"{self.location}/{model_version_id}/{requests.utils.quote(name)}"
+        return os.path.join(self.location, str(model_version_id), name)
+
+    def _copy_stream(self, chunks, target_path):
+        sha256_hash = hashlib.sha256()
+        with open(target_path, 'wb') as f:
+            for chunk in chunks:
+                if self.bandwidth_limiter:
+                    self.bandwidth_limiter.consume(len(chunk))
+                sha256_hash.update(chunk)
+                f.write(chunk)
+        return sha256_hash.hexdigest()
+
+    def _read_chunks(self, file_path):
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b""):
+                yield chunk
+
+    def get_manifest(self, model_version_id):
+        manifest_entry = self._entry(model_version_id, 'manifest.json')
+        try:
+            if self.is_remote:
+                response = requests.get(manifest_entry, timeout=5)
+                return response.json() if response.status_code == 200 else None
+            with open(manifest_entry, 'r') as f:
+                return json.load(f)
+        except (requests.exceptions.RequestException, OSError, ValueError):
+            return None
+
+    def fetch(self, model_version_id, target_dir, accept=None):
+        manifest = self.get_manifest(model_version_id)
+        if not manifest:
+            return None
+        file_name = manifest.get('filename') if isinstance(manifest, dict) else None
+        # The name ends up in a local path, so anything but a plain file name is refused
+        if not isinstance(file_name, str) or os.path.basename(file_name) != file_name or file_name in ('', '.', '..'):
+            print(colored(f"⚠️ Ignoring the invalid LAN cache manifest of version {model_version_id}.", "red"))
+            return None
+        if accept and not accept(file_name, str(manifest.get('sha256', ''))):
+            print(colored(f"📦 Cached {file_name} does not match your file preferences. Downloading from CivitAI instead.", "yellow"))
+            return None
+        target_path = os.path.join(target_dir, file_name)
+        print(colored(f"📦 Found {file_name} in the LAN cache. Fetching it from {self.location}...", "cyan"))
+        try:
+            if self.is_remote:
+                with requests.get(self._entry(model_version_id, file_name), stream=True, timeout=10) as response:
+                    response.raise_for_status()
+                    file_hash = self._copy_stream(response.iter_content(chunk_size=self.CHUNK_SIZE), target_path)
+            else:
+                file_hash = self._copy_stream(self._read_chunks(self._entry(model_version_id, file_name)), target_path)
+        except (requests.exceptions.RequestException, OSError) as e:
+            print(f"Failed to fetch {file_name} from the cache: {e}")
+            if os.path.exists(target_path):
+                os.remove(target_path)
+            return None
+
+        if file_hash != str(manifest.get('sha256', '')).lower():
+            print(colored(f"⚠️ Cached copy of {file_name} is corrupt. Downloading from CivitAI instead.", "red"))
+            os.remove(target_path)
+            return None
+        return target_path
+
+    def store(self, model_version_id, file_path, file_hash):
+        file_name = os.path.basename(file_path)
+        manifest = {'filename': file_name, 'sha256': file_hash, 'size': os.path.getsize(file_path)}
+        try:
+            if self.is_remote:
+                # Needs a mirror that accepts PUT (e.g. nginx with WebDAV enabled)
+                with open(file_path, 'rb') as f:
+                    requests.put(self._entry(model_version_id, file_name), data=f, timeout=60).raise_for_status()
+                requests.put(self._entry(model_version_id, 'manifest.json'), json=manifest, timeout=10).raise_for_status()
+            else:
+                entry_dir = os.path.join(self.location, str(model_version_id))
+                os.makedirs(entry_dir, exist_ok=True)
+                # Write under a temporary name first so other nodes never see a partial file
+                temp_path = os.path.join(entry_dir, f".{file_name}.partial")
+                shutil.copyfile(file_path, temp_path)
+                os.replace(temp_path, os.path.join(entry_dir, file_name))
+                with open(os.path.join(entry_dir, 'manifest.json.partial'), 'w') as f:
+                    json.dump(manifest, f, indent=4)
+                os.replace(os.path.join(entry_dir, 'manifest.json.partial'), os.path.join(entry_dir, 'manifest.json'))
+            print(colored(f"📦 Added {file_name} to the LAN cache.", "cyan"))
+        except (requests.exceptions.RequestException, OSError) as e:
+            print(f"Failed to add {file_name} to the cache: {e}")
+
+class FailedDownloadQueue:
+    # Dead-letter queue of failed downloads, persisted so it survives restarts
+    BASE_DELAY = 60  # Seconds before the first retry, doubled on every attempt
+    MAX_DELAY = 3600
+    MAX_ATTEMPTS = 8
+
+    def __init__(self, path='failed_downloads.json'):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.entries, f, indent=4)
+
+    def find(self, version_id=None, model_id=None):
+        for entry in self.entries:
+            if version_id is not None and str(entry.get('version_id')) == str(version_id):
+                return entry
+            if version_id is None and model_id is not None and entry.get('version_id') is None and str(entry.get('model_id')) == str(model_id):
+                return entry
+        return None
+
+    def append(self, failed_download):
+        error = failed_download.get('error')
+        error_class = type(error).__name__ if isinstance(error, Exception) else (error or 'Unknown')
+        now = time.time()
+        with self.lock:
+            entry = self.find(failed_download.get('version_id'), failed_download.get('model_id'))
+            if entry is None:
+                entry = {'type': failed_download.get('type', 'Unknown'), 'model_id': failed_download.get('model_id'),
+                         'version_id': failed_download.get('version_id'), 'attempts': 0, 'first_failed_at': now}
+                self.entries.append(entry)
+            if failed_download.get('type', 'Unknown') != 'Unknown':
+                entry['type'] = failed_download['type']
+            entry['attempts'] += 1
+            # Terminal errors (no space, nothing downloadable) are only retried on request
+            entry['terminal'] = bool(failed_download.get('terminal'))
+            entry['error_class'] = error_class
+            entry['error'] = str(error) if error else None
+            entry['last_failed_at'] = now
+            entry['next_attempt_at'] = now + min(self.BASE_DELAY * 2 ** (entry['attempts'] - 1), self.MAX_DELAY)
+            self.save()
+
+    def remove(self, version_id=None, model_id=None):
+        with self.lock:
+            entry = self.find(version_id, model_id)
+            if entry is not None:
+                self.entries.remove(entry)
+                self.save()
+
+    def clear(self):
+        with self.lock:
+            self.entries = []
+            self.save()
+
+    def due_entries(self, force=False):
+        now = time.time()
+        with self.lock:
+            return [
+                dict(entry) for entry in self.entries
+                if entry['attempts'] < self.MAX_ATTEMPTS and (force or (not entry.get('terminal') and entry['next_attempt_at'] <= now))
+            ]
+
+class SafetensorsIdentifier:
+    # Identifies .safetensors files from their JSON header alone: an 8-byte little-endian
+    # length followed by the header, so no tensor data has to be read or hashed
+    MAX_HEADER_SIZE = 100 * 1024 * 1024
+    TRAINING_KEYS = ['ss_output_name', 'ss_sd_model_name', 'ss_network_module', 'ss_num_epochs', 'ss_num_train_images',
+                     'ss_learning_rate', 'ss_resolution', 'ss_training_comment', 'ss_training_started_at']
+
+    @classmethod
+    def read_header(cls, file_path):
+        with open(file_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if len(mm) < 8:
+                    raise ValueError("File too small for a safetensors header")
+                header_size = struct.unpack('<Q', mm[:8])[0]
+                if header_size > min(len(mm) - 8, cls.MAX_HEADER_SIZE):
+                    raise ValueError("Invalid safetensors header size")
+                header = json.loads(mm[8:8 + header_size])
+        if not isinstance(header, dict):
+            raise ValueError("Invalid safetensors header")
+        return header
+
+    @staticmethod
+    def classify(tensor_names, metadata):
+        network_module = metadata.get('ss_network_module', '')
+        if any('hada_' in name or 'lokr_' in name for name in tensor_names) or 'lycoris' in network_module:
+            return 'LoCon'
+        if any('lora_up' in name or 'lora_down' in name or '.lora_A.' in name or '.lora_B.' in name for name in tensor_names) or 'lora' in network_module:
+            return 'LORA'
+        if any(name.startswith(('control_model.', 'controlnet_')) for name in tensor_names):
+            return 'Controlnet'
+        if any(name.startswith(('model.diffusion_model.', 'conditioner.', 'cond_stage_model.')) for name in tensor_names):
+            return 'Checkpoint'
+        vae_prefixes = ('encoder.', 'decoder.', 'quant_conv.', 'post_quant_conv.', 'first_stage_model.')
+        if tensor_names and all(name.startswith(vae_prefixes) for name in tensor_names):
+            return 'VAE'
+        if tensor_names and (set(tensor_names) <= {'emb_params', 'clip_l', 'clip_g'} or any(name.startswith('string_to_param') for name in tensor_names)):
+            return 'TextualInversion'
+        return 'Other'
+
+    @classmethod
+    def identify(cls, file_path):
+        header = cls.read_header(file_path)
+        metadata = header.pop('__metadata__', None) or {}
+        tensor_names = list(header)
+        dtypes = Counter(tensor.get('dtype') for tensor in header.values() if isinstance(tensor, dict))
+        sdxl = any(name.startswith(('conditioner.embedders.1.', 'lora_te2_')) for name in tensor_names)
+        return {
+            "type": cls.classify(tensor_names, metadata),
+            "tensor_count": len(tensor_names),
+            "dtype": dtypes.most_common(1)[0][0] if dtypes else None,
+            "base_model": metadata.get('ss_base_model_version') or metadata.get('modelspec.architecture') or ('SDXL' if sdxl else None),
+            "network_dim": metadata.get('ss_network_dim'),
+            "network_alpha": metadata.get('ss_network_alpha'),
+            "training": {key: metadata[key] for key in cls.TRAINING_KEYS if key in metadata},
+        }
+
+class PreviewImagePipeline:
+    # Saves .preview.png sidecars off the download path: the image is streamed to disk,
+    # then resized to at most preview_max_size pixels and stored as a real PNG
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, settings_cli, max_workers=4):
+        self.settings_cli = settings_cli
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.log_path = None  # Set by the menu, so worker messages never land in a prompt
+
+    def submit(self, image_url, preview_file_path):
+        ensure_imported(requests, Image)
+        future = self.executor.submit(self.save_preview_logged, image_url, preview_file_path)
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self.discard)
+        return future
+
+    def discard(self, future):
+        with self.lock:
+            self.pending.discard(future)
+
+    def wait(self):
+        with self.lock:
+            pending = list(self.pending)
+        if pending:
+            print(f"⏳ Waiting for {len(pending)} preview image(s)...")
+        for future in pending:
+            future.result()
+
+    def save_preview_logged(self, image_url, preview_file_path):
+        if not self.log_path:
+            return self.save_preview(image_url, preview_file_path)
+        with ThreadOutput.to_file(self.log_path):
+            return self.save_preview(image_url, preview_file_path)
+
+    def save_preview(self, image_url, preview_file_path):
+        max_size = self.settings_cli.preview_max_size
+        # Ask the image CDN for a smaller variant when possible
+        url = ThumbnailCache.reduced_width_url(image_url, max_size) if max_size else image_url
+        download_path = f"{preview_file_path}.{threading.get_ident()}.part"
+        png_path = f"{preview_file_path}.{threading.get_ident()}.tmp"
+        try:
+            with requests.get(url, stream=True, timeout=30) as response:
+                if response.status_code != 200:
+                    print(f"Failed to download image from {image_url}.")
+                    return False
+                with open(download_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                        f.write(chunk)
+
+            with Image.open(download_path) as img:
+                if max_size:
+                    img.draft('RGB', (max_size, max_size))  # Let JPEG decode at a reduced scale
+                    img.thumbnail((max_size, max_size))
+                if img.mode not in ('RGB', 'RGBA', 'L', 'P'):
+                    img = img.convert('RGBA' if 'A' in img.mode else 'RGB')
+                img.save(png_path, format='PNG')
+            os.replace(png_path, preview_file_path)
+            return True
+        except (requests.RequestException, OSError) as e:
+            print(f"Failed to save preview image from {image_url}: {e}")
+            return False
+        finally:
+            for path in (download_path, png_path):
+                if os.path.exists(path):
+                    os.remove(path)
 
 class Downloader:
+    DOWNLOAD_URL = 'https://civitai.com/api/download/models/'
+    ARIA2_START_ATTEMPTS = 3  # Private aria2c processes, each on a newly probed port
+
     def __init__(self, api_handler, settings_cli, main_cli, root_directory=None):
         self.settings_cli = settings_cli
         self.main_cli = main_cli
         self.api_handler = api_handler
         self.root_directory = root_directory
-        self.failed_downloads_list = []
+        self.failed_downloads_list = FailedDownloadQueue()
+        self.retry_event = threading.Event()
+        self.retry_thread = None
+        self.aria2_rpc = None
+        self.model_cache = None
+        self.download_sizes = {}
+        self.reserved_space = {}  # version_id -> (device, bytes) for downloads in progress
+        self.reservation_lock = threading.Lock()
+        self.aria2_rpc_lock = threading.Lock()
+        self.bandwidth_limiter = BandwidthLimiter(settings_cli)
+        self.active_processes = 0
+        self.active_processes_lock = threading.Lock()
+        self.active_downloads = Counter()  # Version ID -> downloads of it running right now
+        self.preview_pipeline = PreviewImagePipeline(settings_cli)
         self.type_to_path = {
             "Checkpoint": "models/Stable-diffusion",
             "TextualInversion": "embeddings",
@@ -909,8 +2326,11 @@ class Downloader:
             "Other": "models/Other"
         }
 
+        self.FICLONE = 0x40049409  # Linux ioctl request for reflink copies
         self.MAX_RETRIES = 3  # Maximum number of retries
         self.RETRY_DELAY = 5  # Delay in seconds between retries        
+        self.ARCHIVE_TYPES = ["Wildcards", "Poses", "Workflows"]  # Usually published as zip archives
+        self.MIN_FREE_SPACE = 512 * 1024 * 1024  # Keep this much space free on every target disk
         self.default_download_dir = root_directory or os.path.join(os.path.expanduser("~"), 'Downloads')
         print(colored(f"🚀 Downloader initialized with root directory {self.default_download_dir}", "green"))
 
@@ -918,8 +2338,7 @@ class Downloader:
     def format_html_to_text(html_content):
         if html_content is None:
             return "N/A"
-        soup = BeautifulSoup(html_content, 'html.parser')
-        return soup.get_text()
+        return ModelDisplay.html_to_text(html_content)
 
     def map_sd_version(self, base_model):
         mapping = {
@@ -946,7 +2365,7 @@ class Downloader:
             model = self.api_handler.get_model_by_id(model_id)
         except requests.exceptions.RequestException as e:
             print(f"Failed to get model by ID {model_id}. Error: {e}")
-            self.failed_downloads_list.append({'type': 'Unknown', 'version_id': model_id})
+            self.failed_downloads_list.append({'type': 'Unknown', 'model_id': model_id, 'version_id': None, 'error': e})
             return
         
         if not model:
@@ -1006,7 +2425,7 @@ class Downloader:
                     time.sleep(self.RETRY_DELAY)
                 else:  
                     # If it's the last attempt, log the failure and return
-                    self.failed_downloads_list.append({'type': 'Unknown', 'version_id': model_id})
+                    self.failed_downloads_list.append({'type': 'Unknown', 'model_id': model_id, 'version_id': version_id, 'error': e})
                     return
 
         if not model:
@@ -1030,78 +2449,254 @@ class Downloader:
         else:
             print("No versions available for this model.")
 
+    def download_with_aria2_process(self, redirect_url, temp_dir, silent):
+        with self.active_processes_lock:
+            self.active_processes += 1
+        try:
+            self.run_aria2_process(redirect_url, temp_dir, silent)
+        finally:
+            with self.active_processes_lock:
+                self.active_processes -= 1
+
+    def process_download_limit(self):
+        # Live aria2c processes split the budget evenly, re-split whenever one starts or ends
+        limit = self.bandwidth_limiter.current_limit()
+        with self.active_processes_lock:
+            active_processes = max(self.active_processes, 1)
+        return max(limit // active_processes, 1) if limit else 0
+
+    def run_aria2_process(self, redirect_url, temp_dir, silent):
+        # Every file still gets its own aria2c, but with RPC on a private port, so its limit
+        # follows the shared budget, schedule windows and setting changes while it runs
+        for attempt in range(self.ARIA2_START_ATTEMPTS):
+            # The probed port can be taken before aria2c binds it, then try another one
+            aria2_rpc = Aria2RPCClient('127.0.0.1', Aria2RPCClient.free_port(), secret=os.urandom(16).hex(), download_limit=self.process_download_limit)
+            try:
+                aria2_rpc.ensure_running()
+                break
+            except Aria2RPCError:
+                if attempt == self.ARIA2_START_ATTEMPTS - 1:
+                    raise
+        try:
+            gid = aria2_rpc.add_uri(redirect_url, temp_dir)
+            aria2_rpc.wait_for_download(gid, silent=silent)
+        finally:
+            aria2_rpc.shutdown()
+
+    def get_aria2_rpc(self):
+        with self.aria2_rpc_lock:
+            if self.aria2_rpc is None:
+                self.aria2_rpc = Aria2RPCClient(bandwidth_limiter=self.bandwidth_limiter)
+            self.aria2_rpc.ensure_running()
+        return self.aria2_rpc
+
+    def download_with_aria2_rpc(self, redirect_url, temp_dir, silent):
+        # All downloads share one aria2c daemon, so concurrent jobs multiplex on it
+        aria2_rpc = self.get_aria2_rpc()
+        gid = aria2_rpc.add_uri(redirect_url, temp_dir)
+        aria2_rpc.wait_for_download(gid, silent=silent)
+
+    def select_version_file(self, version_files):
+        # Pick the file that best matches the preferred format, precision and size
+        preferences = self.settings_cli.file_preferences
+        candidates = [f for f in version_files if f.get('type') in ('Model', 'Pruned Model')] or list(version_files)
+        if preferences.get('skip_pickle'):
+            candidates = [f for f in candidates if (f.get('metadata') or {}).get('format') != 'PickleTensor']
+        if preferences.get('max_size_mb'):
+            candidates = [f for f in candidates if (f.get('sizeKB') or 0) <= preferences['max_size_mb'] * 1024]
+        if not candidates:
+            return None
+
+        def preference_key(file_info):
+            metadata = file_info.get('metadata') or {}
+            matches = sum(1 for key in ['format', 'fp', 'size'] if preferences.get(key) and metadata.get(key) == preferences[key])
+            return (-matches, not file_info.get('primary'), file_info.get('sizeKB') or 0)
+
+        return min(candidates, key=preference_key)
+
+    def matches_file_preferences(self, model_version_id, file_name, file_hash=None):
+        # A copy from the cache or the library is only used if it is the file the preferences pick
+        if not self.settings_cli.file_preferences:
+            return True
+        model_version_details = self.api_handler.get_model_version_by_id(model_version_id)
+        if not model_version_details:
+            return True
+        file_info = self.select_version_file(model_version_details.get('files', []))
+        if file_info is None:
+            return False
+        preferred_hash = (file_info.get('hashes', {}).get('SHA256') or '').lower()
+        if file_hash and preferred_hash:
+            return file_hash.lower() == preferred_hash
+        return file_info.get('name') == file_name
+
     @staticmethod
-    def spinning_cursor():
-        global spin
-        spinner = "|/-\\"
-        i = 0
-        while spin:
-            print(f"   Downloading... {spinner[i % len(spinner)]}", end="\r", flush=True)
-            time.sleep(0.2)
-            i += 1
-        print("   Download complete!", end="\r", flush=True)
-        
+    def get_file_download_params(file_info):
+        metadata = file_info.get('metadata') or {}
+        params = {'type': file_info.get('type')} if file_info.get('type') else {}
+        params.update({key: metadata[key] for key in ['format', 'size', 'fp'] if metadata.get(key)})
+        return params
+
+    def download_from_civitai(self, model_version_id, temp_dir, silent):
+        initial_url = f"{self.DOWNLOAD_URL}{model_version_id}"
+        if self.settings_cli.file_preferences:
+            # Ask for a specific file of the version instead of its default one
+            model_version_details = self.api_handler.get_model_version_by_id(model_version_id)
+            if model_version_details:
+                file_info = self.select_version_file(model_version_details.get('files', []))
+                if file_info is None:
+                    print(colored(f"🚫 No file of version {model_version_id} matches your file preferences. Skipping.", "red"))
+                    return False
+                print(f"Selected {file_info.get('name')} ({ModelDisplay.convert_size(file_info.get('sizeKB') or 0)})")
+                params = self.get_file_download_params(file_info)
+                if params:
+                    initial_url = f"{initial_url}?{urlencode(params)}"
+        with metrics.span('resolve_download_url'):
+            response = requests.get(initial_url, allow_redirects=False)
+
+        # Check if redirected to a login page
+        if 'login' in response.headers.get('Location', '').lower():
+            # Model requires login, check for API key
+            api_key = os.getenv('CIVITAI_API_KEY', '')
+            if not api_key:
+                print("Warning: Model requires login. No valid API key found. Cannot download this model.")
+                return False
+
+            headers = {'Authorization': f'Bearer {api_key}'}
+            response = requests.get(initial_url, headers=headers, allow_redirects=False)
+
+            if 'login' in response.url.lower():
+                print("Warning: Model requires login and cannot be downloaded even with the provided API key.")
+                return False
+
+        # Capture the final URL after redirection (if any)
+        redirect_url = response.headers.get('Location', initial_url)
+
+        # Step 2: Download using `aria2c`
+        with metrics.span('aria2_download', backend=self.settings_cli.download_backend):
+            if self.settings_cli.download_backend == 'rpc':
+                self.download_with_aria2_rpc(redirect_url, temp_dir, silent)
+            else:
+                self.download_with_aria2_process(redirect_url, temp_dir, silent)
+        return True
+
+    def get_model_cache(self):
+        cache_location = self.settings_cli.cache_location
+        if not cache_location:
+            return None
+        if self.model_cache is None or self.model_cache.location != cache_location:
+            self.model_cache = ModelCache(cache_location, self.bandwidth_limiter)
+        return self.model_cache
+
+    def store_in_model_cache(self, model_cache, model_version_id, file_path):
+        # Only verified files go into the cache
+        model_version_details = self.api_handler.get_model_version_by_id(model_version_id)
+        if not model_version_details:
+            return
+        file_name = os.path.basename(file_path)
+        version_files = model_version_details.get('files', [])
+        file_info = next((f for f in version_files if f.get('name') == file_name), None)
+        if file_info is None:
+            file_info = next((f for f in version_files if f.get('primary')), version_files[0] if version_files else {})
+        expected_hash = (file_info.get('hashes', {}).get('SHA256') or '').lower()
+        if not expected_hash:
+            return
+        file_hash = self.generate_sha256(file_path)
+        if file_hash != expected_hash:
+            print(colored(f"⚠️ SHA-256 of {file_name} does not match CivitAI. Not adding it to the cache.", "red"))
+            return
+        model_cache.store(model_version_id, file_path, file_hash)
+
     def download_model_by_id(self, model_version_id, final_download_path, model_type, silent=True, failed_downloads_list=None):
+        # With tracing enabled, every step of the download ends up in one trace
+        # Returns whether the model is now in final_download_path
+        daemon_client = self.main_cli.daemon_client if self.main_cli else None
+        if daemon_client:
+            return self.download_through_daemon(daemon_client, model_version_id, model_type, silent, failed_downloads_list)
+        with self.active_processes_lock:
+            self.active_downloads[str(model_version_id)] += 1
         try:
-            global spin
-            with tempfile.TemporaryDirectory() as temp_dir:
-                initial_url = f"https://civitai.com/api/download/models/{model_version_id}"
-                response = requests.get(initial_url, allow_redirects=False)
-
-                # Check if redirected to a login page
-                if 'login' in response.headers.get('Location', '').lower():
-                    # Model requires login, check for API key
-                    api_key = os.getenv('CIVITAI_API_KEY', '')
-                    if not api_key:
-                        print("Warning: Model requires login. No valid API key found. Cannot download this model.")
-                        return
-
-                    headers = {'Authorization': f'Bearer {api_key}'}
-                    response = requests.get(initial_url, headers=headers, allow_redirects=False)
-
-                    if 'login' in response.url.lower():
-                        print("Warning: Model requires login and cannot be downloaded even with the provided API key.")
-                        return
-
-                # Capture the final URL after redirection (if any)
-                redirect_url = response.headers.get('Location', initial_url)
-
-                # Step 2: Download using `aria2c`
-                aria2_command = [
-                    "aria2c",
-                    redirect_url,
-                    "--dir", temp_dir,
-                    "--content-disposition"
-                ]
-                if silent:
-                    process = Popen(aria2_command, stdout=PIPE, stderr=PIPE)
-                    process = Popen(aria2_command, stdout=PIPE, stderr=PIPE)
-                    stdout, stderr = process.communicate()
-                    print(f"stdout: {stdout.decode('utf-8')}")
-                    print(f"stderr: {stderr.decode('utf-8')}")
-                else:
-                    # Start the spinner in a separate thread
-                    spin = True
-                    spinner_thread = threading.Thread(target=self.spinning_cursor)
-                    spinner_thread.start()
+            with metrics.span('download_model', version_id=model_version_id, model_type=model_type):
+                return self._download_model_by_id(model_version_id, final_download_path, model_type, silent, failed_downloads_list)
+        finally:
+            with self.active_processes_lock:
+                self.active_downloads[str(model_version_id)] -= 1
+                if not self.active_downloads[str(model_version_id)]:
+                    del self.active_downloads[str(model_version_id)]
+
+    def download_through_daemon(self, daemon_client, model_version_id, model_type, silent, failed_downloads_list):
+        # The daemon's queue downloads into the folder of the model type and keeps failures for its retry worker
+        records = []
+        job_client = daemon_client.open_connection()
+        try:
+            if job_client is None:
+                raise DaemonError("The daemon is no longer running")
+            job_client.run({'command': 'download', 'ids': [str(model_version_id)]}, on_record=records.append)
+        except (DaemonError, OSError) as e:
+            # The job never reached the daemon, so it is retried from here
+            (self.failed_downloads_list if failed_downloads_list is None else failed_downloads_list).append({'type': model_type, 'version_id': model_version_id, 'error': e})
+            records.append({'error': str(e)})
+        finally:
+            if job_client:
+                job_client.close()
+        errors = [record['error'] for record in records if 'error' in record]
+        if errors:
+            print(colored(f"🚫 Downloading version {model_version_id} through the daemon failed: {errors[-1]}", "red"))
+            return False
+        if not silent:
+            print(colored(f"✅ Version {model_version_id} downloaded by the daemon.", "green"))
+        return True
 
-                    # Redirect aria2's output to a log file
-                    with open("aria2_output.log", "w") as f:
-                        process = Popen(aria2_command, stdout=f, stderr=f)
-                        process.wait()
+    def active_download_count(self):
+        with self.active_processes_lock:
+            return sum(self.active_downloads.values())
 
-                    # Stop the spinner when the download is done
-                    spin = False
+    def is_downloading(self, model_version_id):
+        with self.active_processes_lock:
+            return str(model_version_id) in self.active_downloads
+
+    def _download_model_by_id(self, model_version_id, final_download_path, model_type, silent, failed_downloads_list):
+        if failed_downloads_list is None:
+            failed_downloads_list = self.failed_downloads_list
+        try:
+            # Link an already downloaded copy instead of fetching it again
+            existing_file_path = self.find_existing_model_file(model_version_id)
+            if existing_file_path and self.link_existing_model(existing_file_path, final_download_path):
+                self.failed_downloads_list.remove(model_version_id)
+                return True
+            # Refuse the job before any bytes are spent if it cannot fit
+            with metrics.span('reserve_space'):
+                reserved = self.reserve_space(model_version_id, final_download_path)
+            if not reserved:
+                failed_downloads_list.append({'type': model_type, 'version_id': model_version_id, 'error': 'InsufficientSpace', 'terminal': True})
+                return False
+            # Download next to the models so the final move is a cheap rename on the same filesystem
+            os.makedirs(self.default_download_dir, exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=self.default_download_dir, prefix='.download-') as temp_dir:
+                # Try the LAN cache first, then fall back to CivitAI
+                model_cache = self.get_model_cache()
+                download_start = time.perf_counter()
+                with metrics.span('fetch_file'):
+                    fetched_from_cache = bool(model_cache and model_cache.fetch(model_version_id, temp_dir, accept=lambda file_name, file_hash: self.matches_file_preferences(model_version_id, file_name, file_hash)))
+                    if model_cache:
+                        metrics.record_cache_lookup('lan', fetched_from_cache)
+                    if not fetched_from_cache and not self.download_from_civitai(model_version_id, temp_dir, silent):
+                        # Login required or no file matches the preferences, waiting will not change that
+                        failed_downloads_list.append({'type': model_type, 'version_id': model_version_id, 'error': 'NotDownloadable', 'terminal': True})
+                        return False
+                download_seconds = time.perf_counter() - download_start
 
-                    # Wait for the spinner to stop
-                    spinner_thread.join()
-                
                 # Assume the temporary directory now contains one file, the downloaded file.
                 # Get its name
                 downloaded_files = os.listdir(temp_dir)
                 if downloaded_files:
                     downloaded_file_name = downloaded_files[0]
                     downloaded_file_path = os.path.join(temp_dir, downloaded_file_name)
+                    metrics.record_download(model_version_id, 'cache' if fetched_from_cache else 'civitai', os.path.getsize(downloaded_file_path), download_seconds)
+
+                    # Share verified downloads with the other nodes
+                    if model_cache and not fetched_from_cache:
+                        with metrics.span('store_in_cache'):
+                            self.store_in_model_cache(model_cache, model_version_id, downloaded_file_path)
                     
                     # Extract the name without extension to use for metadata
                     model_name, _ = os.path.splitext(downloaded_file_name)
@@ -1110,24 +2705,340 @@ class Downloader:
                     os.makedirs(final_download_path, exist_ok=True)
 
                     # Fetch metadata
-                    self.download_metadata(model_version_id, model_type, model_name)
-
-                    # Move the file to the final destination
-                    try:
-                        shutil.move(downloaded_file_path, os.path.join(final_download_path, downloaded_file_name))
-                        self.main_cli.scan_directory_for_models(self.settings_cli.root_directory)
-                        print("updated index")
-                    except (FileNotFoundError, PermissionError) as e:
-                        print(f"Error in moving the file: {e}")
+                    with metrics.span('fetch_metadata'):
+                        model_version_details = self.download_metadata(model_version_id, model_type, model_name)
+
+                    extracted_files = None
+                    if self.should_extract_archive(model_type, downloaded_file_path):
+                        # Unpack straight into the target folder instead of moving the archive
+                        archive_hash = self.generate_sha256(downloaded_file_path)
+                        extracted_files = self.extract_archive(downloaded_file_path, final_download_path)
+                    if extracted_files is not None:
+                        self.main_cli.add_archive_to_index(model_version_id, downloaded_file_name, extracted_files, archive_hash, model_version_details)
+                        print(f"Extracted {len(extracted_files)} files from {downloaded_file_name} into {final_download_path}")
+                        self.failed_downloads_list.remove(model_version_id)
+                        return True
+                    else:
+                        # Move the file to the final destination
+                        try:
+                            with metrics.span('move_and_index'):
+                                shutil.move(downloaded_file_path, os.path.join(final_download_path, downloaded_file_name))
+                                self.main_cli.scan_directory_for_models(self.settings_cli.root_directory)
+                            print("updated index")
+                            self.failed_downloads_list.remove(model_version_id)
+                            return True
+                        except (FileNotFoundError, PermissionError) as e:
+                            print(f"Error in moving the file: {e}")
+                            failed_downloads_list.append({'type': model_type, 'version_id': model_version_id, 'error': e})
+                            return False
 
                 else:
                     print("No file was downloaded.")
-        except requests.exceptions.RequestException as e:  # Catching all requests exceptions
+                    metrics.increment('civitai_downloads_total', source='civitai', result='failed')
+                    failed_downloads_list.append({'type': model_type, 'version_id': model_version_id, 'error': 'NoFileDownloaded'})
+                    return False
+        except (requests.exceptions.RequestException, Aria2RPCError) as e:  # Catching all requests and aria2 RPC exceptions
             print(f"Error downloading {model_type} with version ID {model_version_id}. Will retry later.")
             print(f"Error details: {e}")
-            if failed_downloads_list is not None:
-                failed_downloads_list.append({'type': model_type, 'version_id': model_version_id})
+            metrics.increment('civitai_downloads_total', source='civitai', result='failed')
+            failed_downloads_list.append({'type': model_type, 'version_id': model_version_id, 'error': e})
+            return False
+        finally:
+            self.release_space(model_version_id)
+
+    def retry_failed_download(self, entry):
+        version_id = entry.get('version_id')
+        model_type = entry.get('type', 'Unknown')
+        try:
+            if version_id is None:
+                # Only the model is known, so retry its newest version
+                model = self.api_handler.get_model_by_id(entry['model_id'])
+                model_versions = model.get('modelVersions', []) if model else []
+                if not model_versions:
+                    raise requests.exceptions.RequestException(f"Could not fetch model with ID: {entry['model_id']}")
+                version_id = model_versions[0].get('id')
+                model_type = model.get('type', 'Unknown')
+                self.failed_downloads_list.remove(model_id=entry['model_id'])
+            elif model_type == 'Unknown':
+                model_version_details = self.api_handler.get_model_version_by_id(version_id)
+                if model_version_details is None:
+                    raise requests.exceptions.RequestException(f"Could not fetch model version with ID: {version_id}")
+                model_type = model_version_details.get('model', {}).get('type', 'Unknown')
+        except requests.exceptions.RequestException as e:
+            self.failed_downloads_list.append(dict(entry, error=e))
+            return
+        print(colored(f"🔁 Retrying download of version {version_id} (attempt {entry['attempts'] + 1})", "cyan"))
+        self.download_model_by_id(version_id, self.get_download_path(model_type), model_type, silent=True)
+
+    def retry_failed_downloads(self, force=False):
+        for entry in self.failed_downloads_list.due_entries(force):
+            if entry.get('version_id') is not None and self.is_downloading(entry['version_id']):
+                continue  # A foreground download is already fetching it
+            # One bad entry must not stop the others, nor kill the retry worker
+            try:
+                self.retry_failed_download(entry)
+            except Exception as e:
+                print(f"⚠️ Retrying version {entry.get('version_id')} failed: {type(e).__name__}: {e}")
+                self.failed_downloads_list.append(dict(entry, error=e))
+
+    def retry_worker(self, poll_interval=30, log_path=None):
+        while not self.retry_event.wait(poll_interval):
+            if log_path:
+                with ThreadOutput.to_file(log_path):
+                    self.retry_failed_downloads()
+            else:
+                self.retry_failed_downloads()
+
+    def start_retry_worker(self, log_path=None):
+        if self.retry_thread is None:
+            self.retry_thread = threading.Thread(target=self.retry_worker, kwargs={'log_path': log_path}, daemon=True)
+            self.retry_thread.start()
+
+    def get_download_size(self, model_version_id, model_version_details=None):
+        # Size in bytes from the version metadata, falling back to a HEAD request
+        if model_version_id in self.download_sizes:
+            return self.download_sizes[model_version_id]
+        size = None
+        if model_version_details is None:
+            model_version_details = self.api_handler.get_model_version_by_id(model_version_id)
+        version_files = model_version_details.get('files', []) if model_version_details else []
+        file_info = (self.select_version_file(version_files) if version_files else None) or {}
+        if file_info.get('sizeKB'):
+            size = int(file_info['sizeKB'] * 1024)
+        else:
+            try:
+                api_key = os.getenv('CIVITAI_API_KEY', '')
+                headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
+                response = requests.head(f"{self.DOWNLOAD_URL}{model_version_id}", headers=headers, allow_redirects=True, timeout=10)
+                if response.status_code == 200 and response.headers.get('Content-Length'):
+                    size = int(response.headers['Content-Length'])
+            except requests.exceptions.RequestException:
+                pass
+        self.download_sizes[model_version_id] = size
+        return size
+
+    @staticmethod
+    def get_free_space(path):
+        # The target folder may not exist yet, so check its nearest existing parent
+        existing_path = os.path.abspath(path)
+        while not os.path.exists(existing_path):
+            existing_path = os.path.dirname(existing_path)
+        return os.stat(existing_path).st_dev, shutil.disk_usage(existing_path).free
+
+    def reserve_space(self, model_version_id, path):
+        size = self.get_download_size(model_version_id)
+        if size is None:
+            return True  # Unknown size, nothing to reserve against
+        with self.reservation_lock:
+            device, free = self.get_free_space(path)
+            reserved = sum(r_size for r_device, r_size in self.reserved_space.values() if r_device == device)
+            if size + reserved + self.MIN_FREE_SPACE > free:
+                print(colored(f"💾 Not enough free space for version {model_version_id}: needs {ModelDisplay.convert_size(size // 1000)}, "
+                              f"{ModelDisplay.convert_size(max(free - reserved, 0) // 1000)} available. Skipping.", "red"))
+                return False
+            self.reserved_space[model_version_id] = (device, size)
+        return True
+
+    def release_space(self, model_version_id):
+        with self.reservation_lock:
+            self.reserved_space.pop(model_version_id, None)
+
+    def describe_download_job(self, job):
+        if job.get('type') and job.get('sizeKB'):
+            self.download_sizes.setdefault(job['version_id'], int(job['sizeKB'] * 1024))
+            return dict(job, size=self.download_sizes[job['version_id']])
+        try:
+            model_version_details = self.api_handler.get_model_version_by_id(job['version_id'])
+            size = self.get_download_size(job['version_id'], model_version_details)
+        except requests.exceptions.RequestException:
+            model_version_details, size = None, None  # Planned with an unknown size, the download reports the error
+        model_type = job.get('type') or (model_version_details or {}).get('model', {}).get('type', 'Unknown')
+        return dict(job, type=model_type, size=size)
+
+    def schedule_downloads(self, jobs):
+        # Jobs are dicts with a 'version_id' and optionally 'type' and 'sizeKB'
+        if not jobs:
+            return []
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            jobs = list(executor.map(self.describe_download_job, jobs))
+
+        download_order = self.settings_cli.download_order
+        if download_order == 'smallest-first':
+            jobs.sort(key=lambda job: job['size'] if job['size'] is not None else float('inf'))
+        elif download_order == 'largest-first':
+            jobs.sort(key=lambda job: job['size'] if job['size'] is not None else -1, reverse=True)
+
+        # Plan the whole queue against the free space of each target filesystem
+        available_space = {}
+        accepted_jobs = []
+        for job in jobs:
+            device, free = self.get_free_space(self.get_download_path(job['type']))
+            if device not in available_space:
+                with self.reservation_lock:
+                    reserved = sum(r_size for r_device, r_size in self.reserved_space.values() if r_device == device)
+                available_space[device] = free - reserved - self.MIN_FREE_SPACE
+            if job['size'] is not None:
+                if job['size'] > available_space[device]:
+                    print(colored(f"💾 Version {job['version_id']} ({ModelDisplay.convert_size(job['size'] // 1000)}) does not fit on disk. Skipping.", "red"))
+                    self.failed_downloads_list.append({'type': job['type'], 'model_id': job.get('model_id'), 'version_id': job['version_id'], 'error': 'InsufficientSpace', 'terminal': True})
+                    continue
+                available_space[device] -= job['size']
+            accepted_jobs.append(job)
+        return accepted_jobs
 
+    def should_extract_archive(self, model_type, file_path):
+        return self.settings_cli.extract_archives and model_type in self.ARCHIVE_TYPES and zipfile.is_zipfile(file_path)
+
+    def extract_archive(self, archive_path, target_dir):
+        # Stream every member into place, no intermediate copy of the whole archive
+        extracted_files = []
+        target_root = os.path.realpath(target_dir)
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        continue
+                    target_path = os.path.realpath(os.path.join(target_root, member.filename))
+                    if os.path.commonpath([target_root, target_path]) != target_root:
+                        print(f"Skipping {member.filename}: it would be extracted outside of {target_dir}")
+                        continue
+                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                    extracted_files.append(target_path)
+                    with archive.open(member) as source, open(target_path, 'wb') as target:
+                        shutil.copyfileobj(source, target, 1024 * 1024)
+        except (zipfile.BadZipFile, OSError) as e:
+            # Remove what was unpacked so far, the caller keeps the archive itself instead
+            print(colored(f"⚠️ Could not extract {os.path.basename(archive_path)}: {e}. Keeping the archive.", "red"))
+            for file_path in extracted_files:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            return None
+        return extracted_files
+
+    def find_existing_model_file(self, model_version_id):
+        model_index = self.main_cli.model_index if self.main_cli else {}
+        for model in model_index.values():
+            if model.get('extracted_files'):
+                continue  # Extracted archives cannot be linked as a single file
+            file_path = model.get('filepath')
+            if str(model.get('modelversionid')) == str(model_version_id) and file_path and os.path.exists(file_path) \
+                    and self.matches_file_preferences(model_version_id, os.path.basename(file_path), model.get('hash')):
+                return file_path
+
+        # Fall back to the file hashes published for this version
+        indexed_hashes = {model.get('hash').lower(): model.get('filepath') for model in model_index.values() if model.get('hash')}
+        if not indexed_hashes:
+            return None
+        model_version_details = self.api_handler.get_model_version_by_id(model_version_id)
+        if not model_version_details:
+            return None
+        for file_info in model_version_details.get('files', []):
+            file_hash = (file_info.get('hashes', {}).get('SHA256') or '').lower()
+            file_path = indexed_hashes.get(file_hash)
+            if file_path and os.path.exists(file_path) and self.matches_file_preferences(model_version_id, file_info.get('name'), file_hash) \
+                    and self.file_matches(file_path, file_info, file_hash):
+                return file_path
+        return None
+
+    def file_matches(self, file_path, file_info, file_hash):
+        # Indexed hashes may come from a stale or copied .civitai.info, so check the bytes before linking
+        if file_info.get('sizeKB') and abs(os.path.getsize(file_path) / 1024 - file_info['sizeKB']) > 1:
+            return False
+        if self.generate_sha256(file_path) != file_hash:
+            print(colored(f"⚠️ {file_path} does not match the SHA-256 in its metadata. Not linking it.", "red"))
+            return False
+        return True
+
+    def link_existing_model(self, existing_file_path, final_download_path):
+        file_name = os.path.basename(existing_file_path)
+        target_file_path = os.path.join(final_download_path, file_name)
+        if os.path.exists(target_file_path):
+            print(colored(f"✅ {file_name} is already downloaded. Skipping.", "green"))
+            return True
+
+        os.makedirs(final_download_path, exist_ok=True)
+        method = self.link_file(existing_file_path, target_file_path)
+        if method is None:
+            return False
+        print(colored(f"🔗 Linked existing {file_name} into {final_download_path} ({method}) instead of downloading it again.", "green"))
+
+        # Bring the metadata sidecars along with the model file
+        base_name, _ = os.path.splitext(file_name)
+        source_folder = os.path.dirname(existing_file_path)
+        for suffix in ['.civitai.info', '.json', '.preview.png']:
+            sidecar_path = os.path.join(source_folder, f"{base_name}{suffix}")
+            if os.path.exists(sidecar_path):
+                shutil.copy2(sidecar_path, os.path.join(final_download_path, f"{base_name}{suffix}"))
+        self.main_cli.scan_directory_for_models(self.settings_cli.root_directory)
+        return True
+
+    def reflink_file(self, source_path, target_path):
+        if fcntl is None:
+            raise OSError("Reflinks are not supported on this platform")
+        with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+            try:
+                fcntl.ioctl(target.fileno(), self.FICLONE, source.fileno())
+            except OSError:
+                target.close()
+                os.remove(target_path)
+                raise
+
+    def link_file(self, source_path, target_path):
+        # Prefer a reflink (independent copy-on-write file), then a hardlink
+        try:
+            self.reflink_file(source_path, target_path)
+            return 'reflink'
+        except OSError:
+            pass
+        try:
+            os.link(source_path, target_path)
+            return 'hardlink'
+        except OSError as e:
+            print(f"Could not link {source_path} to {target_path}: {e}")
+            return None
+
+    def deduplicate_models(self):
+        print(colored("🔍 Looking for duplicate models in the index...", "yellow"))
+        model_index = self.main_cli.load_model_index()
+
+        files_by_hash = {}
+        for model in model_index.values():
+            file_path = model.get('filepath')
+            if model.get('hash') and file_path and os.path.exists(file_path):
+                files_by_hash.setdefault(model['hash'].lower(), []).append(file_path)
+
+        saved_bytes = 0
+        linked_files = 0
+        for file_hash, file_paths in files_by_hash.items():
+            if len(file_paths) < 2:
+                continue
+            original_path = file_paths[0]
+            original_size = os.path.getsize(original_path)
+            for duplicate_path in file_paths[1:]:
+                if os.path.samefile(original_path, duplicate_path):
+                    continue  # Already a hardlink to the same inode
+                if os.path.getsize(duplicate_path) != original_size:
+                    print(colored(f"  ⚠️ {duplicate_path} has a different size than {original_path}. Skipping.", "red"))
+                    continue
+                # The indexed hash may come from .civitai.info, so only identical bytes are linked
+                if not filecmp.cmp(original_path, duplicate_path, shallow=False):
+                    print(colored(f"  ⚠️ {duplicate_path} differs from {original_path} despite the same hash in the index. Skipping.", "red"))
+                    continue
+
+                # Link next to the duplicate, then atomically swap it in
+                temp_path = f"{duplicate_path}.dedup"
+                method = self.link_file(original_path, temp_path)
+                if method is None:
+                    continue
+                os.replace(temp_path, duplicate_path)
+                saved_bytes += original_size
+                linked_files += 1
+                print(f"  🔗 {duplicate_path} -> {original_path} ({method})")
+
+        if linked_files:
+            print(colored(f"✅ Replaced {linked_files} duplicate files, recovered {ModelDisplay.convert_size(saved_bytes // 1000)}.", "green"))
+        else:
+            print(colored("✅ No duplicate models found.", "green"))
 
     def download_model_by_hash(self, hash_value):
         # Fetch model version details by hash
@@ -1152,6 +3063,101 @@ class Downloader:
         # Use existing method to download the model by its version ID
         self.download_model_by_id(model_version_id, final_download_path, model_type)
 
+    def call_api(self, rate_limiter, api_method, *args):
+        rate_limiter.acquire()
+        try:
+            return api_method(*args)
+        except (requests.RequestException, ValueError):
+            return None
+
+    def refresh_model_metadata(self, rate_limiter, model_id, entries):
+        # entries: (index key, index entry, version ID) of every indexed file of this model
+        model_details = self.call_api(rate_limiter, self.api_handler.get_model_by_id, model_id)
+        if model_details is None:
+            return [], [(entry['filepath'], f"failed to fetch model {model_id}") for _, entry, _ in entries]
+
+        # The model response already carries every version, so one request covers all files of the model
+        refreshed, failed = [], []
+        for key, entry, version_id in entries:
+            model_version_details = self.version_info(model_details, {'id': version_id})
+            if model_version_details is None:  # Versions removed from the model listing can still be fetched on their own
+                model_version_details = self.call_api(rate_limiter, self.api_handler.get_model_version_by_id, version_id)
+            if model_version_details is None:
+                failed.append((entry['filepath'], f"failed to fetch version {version_id}"))
+                continue
+            folder = os.path.dirname(entry['filepath'])
+            base_name = os.path.splitext(os.path.basename(entry['filepath']))[0]
+            try:
+                self._save_metadata(model_version_details, model_details.get('type', 'Unknown'), base_name, model_details, folder, quiet=True)
+            except OSError as e:
+                failed.append((entry['filepath'], str(e)))
+                continue
+            refreshed.append((key, model_version_details))
+        return refreshed, failed
+
+    def refresh_all_metadata(self, max_workers=8, requests_per_second=5, keys=None):
+        model_index = self.main_cli.load_model_index()
+        entries = [(key, entry) for key, entry in model_index.items()
+                   if entry.get('filepath') and not entry.get('extracted_files') and os.path.exists(entry['filepath'])
+                   and (keys is None or key in keys)]
+        if not entries:
+            print(colored("No indexed models found. Run a scan first.", "yellow"))
+            return [], []
+
+        print(colored(f"🔄 Refreshing metadata for {len(entries)} indexed models...", "yellow"))
+        rate_limiter = RateLimiter(requests_per_second)
+        by_model_id = {}  # model ID -> [(index key, index entry, version ID)]
+        by_hash = {}  # hash -> [(index key, index entry)] for files without a known model ID
+        for key, entry in entries:
+            if entry.get('modelid'):
+                by_model_id.setdefault(str(entry['modelid']), []).append((key, entry, entry.get('modelversionid')))
+            elif entry.get('hash'):
+                by_hash.setdefault(entry['hash'].lower(), []).append((key, entry))
+        skipped = len(entries) - sum(len(group) for group in by_model_id.values()) - sum(len(group) for group in by_hash.values())
+
+        from tqdm import tqdm
+
+        refreshed, failed = [], []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Files only known by hash are resolved to their model first
+            futures = {executor.submit(self.call_api, rate_limiter, self.api_handler.get_model_by_hash, file_hash): file_hash for file_hash in by_hash}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Resolving hashes", unit="hash", disable=not futures):
+                model_version_details = future.result()
+                for key, entry in by_hash[futures[future]]:
+                    if model_version_details and model_version_details.get('modelId'):
+                        by_model_id.setdefault(str(model_version_details['modelId']), []).append((key, entry, model_version_details.get('id')))
+                    else:
+                        failed.append((entry['filepath'], "not found on CivitAI"))
+
+            futures = [executor.submit(self.refresh_model_metadata, rate_limiter, model_id, group) for model_id, group in by_model_id.items()]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Refreshing metadata", unit="model"):
+                model_refreshed, model_failed = future.result()
+                refreshed.extend(model_refreshed)
+                failed.extend(model_failed)
+
+        self.preview_pipeline.wait()
+
+        # Keep the index in line with the refreshed metadata
+        def update_entries(model_index):
+            for key, model_version_details in refreshed:
+                if key in model_index:
+                    model_index[key].update({
+                        "modelname": model_version_details.get('model', {}).get('name'),
+                        "modelid": model_version_details.get('modelId'),
+                        "modelversionid": model_version_details.get('id'),
+                    })
+        self.main_cli.index.update(update_entries).result()
+
+        for filepath, reason in failed:
+            print(colored(f"  ⚠️ {os.path.basename(filepath)}: {reason}", "red"))
+        summary = f"✅ Refreshed metadata for {len(refreshed)} models"
+        if failed:
+            summary += f", {len(failed)} failed"
+        if skipped:
+            summary += f", {skipped} skipped without model ID or hash"
+        print(colored(summary + ".", "green"))
+        return refreshed, failed
+
     def scan_and_update_metadata(self, folders=None):
         print(colored("=====================================", "yellow"))
         print(colored("🔍 Starting metadata scan...", "yellow"))
@@ -1159,6 +3165,9 @@ class Downloader:
 
         # Dictionary to store filename-hash mapping
         file_hash_mapping = {}
+        scan_start = time.perf_counter()
+        files_scanned = hashed_bytes = 0
+        hash_seconds = 0.0
         if folders is None:
             print(colored("\n⏳ Scanning all folders. This may take some time.", "magenta"))
             folders = list(self.type_to_path.values())
@@ -1176,6 +3185,7 @@ class Downloader:
 
             for filename in os.listdir(download_dir):
                 if any(filename.endswith(ext) for ext in valid_extensions):
+                    files_scanned += 1
                     base_name, ext = os.path.splitext(filename)
                     
                     # Check for accompanying metadata files
@@ -1189,7 +3199,10 @@ class Downloader:
                         
                         # Generate SHA-256 hash for the file
                         file_path = os.path.join(download_dir, filename)
+                        hash_start = time.perf_counter()
                         file_hash = self.generate_sha256(file_path)
+                        hash_seconds += time.perf_counter() - hash_start
+                        hashed_bytes += os.path.getsize(file_path)
 
                         # Store the filename-hash mapping
                         file_hash_mapping[file_hash] = filename
@@ -1202,16 +3215,21 @@ class Downloader:
             else:
                 print(colored("  ✅ All models are up to date. No missing metadata found.", "green"))
 
+        metrics.record_scan('metadata', files_scanned, time.perf_counter() - scan_start, hashed_bytes, hash_seconds)
         print(colored("\n=====================================", "yellow"))
         print(colored("✅ Metadata scan complete.", "yellow"))
         print(colored("=====================================", "yellow"))
 
     def generate_sha256(self, file_path):
         sha256_hash = hashlib.sha256()
+        start = time.perf_counter()
+        size = 0
         with open(file_path, "rb") as f:
-            # Read file in chunks of 4K
-            for byte_block in iter(lambda: f.read(4096), b""):
+            # Read file in chunks of 1M, large reads let hashlib release the GIL
+            for byte_block in iter(lambda: f.read(1024 * 1024), b""):
                 sha256_hash.update(byte_block)
+                size += len(byte_block)
+        metrics.record_hash(size, time.perf_counter() - start)
         return sha256_hash.hexdigest()
 
     def download_metadata_by_hash(self, file_hash, folder, base_name):
@@ -1237,6 +3255,7 @@ class Downloader:
 
         # Use common method to save metadata
         self._save_metadata(model_version_details, model_type, base_name, model_details, folder)
+        return model_version_details
 
     def download_metadata(self, model_version_id, model_type, model_name):
         print(f"Fetching metadata for {model_name} ({model_type}, version: {model_version_id})...")
@@ -1259,9 +3278,46 @@ class Downloader:
 
         # Use common method to save metadata
         self._save_metadata(model_version_details, model_type, model_name, model_details)
+        return model_version_details
 
-    def _save_metadata(self, model_version_details, model_type, model_name, model_details, folder=None):
-        print(f"Saving metadata for {model_name} ({model_type})...")
+    @staticmethod
+    def write_sidecar(file_path, data):
+        # Writes through a temporary file and a rename so readers never see truncated JSON.
+        # Returns False without touching the file when the content is already on disk.
+        content = json.dumps(data, indent=4).encode('utf-8')
+        try:
+            if os.path.getsize(file_path) == len(content):
+                with open(file_path, 'rb') as f:
+                    if f.read() == content:
+                        return False
+        except FileNotFoundError:
+            pass
+
+        # The daemon and a CLI may write the same sidecar, so the name is unique per process and thread
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return True
+
+    @staticmethod
+    def version_info(model_details, model_version_details):
+        # The .civitai.info content. Both the download and the bulk refresh build it from the
+        # version in the model response, so an unchanged version gives byte-identical sidecars.
+        for version in (model_details or {}).get('modelVersions', []):
+            if str(version.get('id')) == str(model_version_details.get('id')):
+                model_info = {key: model_details.get(key) for key in ('name', 'type', 'nsfw', 'poi')}
+                return dict(version, modelId=model_details.get('id'), model=model_info)
+        return model_version_details if model_version_details.get('modelId') else None
+
+    def _save_metadata(self, model_version_details, model_type, model_name, model_details, folder=None, quiet=False):
+        model_version_details = self.version_info(model_details, model_version_details) or model_version_details
+        if not quiet:
+            print(f"Saving metadata for {model_name} ({model_type})...")
         download_folder = self.get_download_path(model_type) if folder is None else folder
         #print(f"Metadata will be saved to: {download_folder}")
         # Determine the folder based on the model type
@@ -1276,8 +3332,7 @@ class Downloader:
         #print(f"Debug: The info_file_path is {info_file_path}")
 
         try:
-            with open(info_file_path, 'w') as f:
-                json.dump(model_version_details, f, indent=4)
+            info_changed = self.write_sidecar(info_file_path, model_version_details)
         except FileNotFoundError as e:
             print(f"FileNotFoundError: {e}")
             return
@@ -1297,28 +3352,744 @@ class Downloader:
         
         # Save the new JSON format
         json_file_path = os.path.join(download_folder, f"{model_name}.json")
-        with open(json_file_path, 'w') as f:
-            json.dump(new_json_format, f, indent=4)
+        self.write_sidecar(json_file_path, new_json_format)
 
-        # Download and save .preview.png
+        # Download and save .preview.png in the background, unless the version (and so its image) is unchanged
         image_url = model_version_details["images"][0].get("url", None) if model_version_details.get("images") else None
         if image_url:
             preview_file_path = os.path.join(download_folder, f"{model_name}.preview.png")
-            response = requests.get(image_url, allow_redirects=False)
-            if response.status_code == 200:
-                with open(preview_file_path, 'wb') as f:
-                    f.write(response.content)
+            if info_changed or not os.path.exists(preview_file_path):
+                self.preview_pipeline.submit(image_url, preview_file_path)
+
+        if not quiet:
+            print(f"Successfully downloaded and saved metadata for {model_name}.")
+
+class ModelSync:
+    # A manifest lists the models a node should have, e.g.
+    # {"workers": 4, "models": [{"model_id": 4201}, {"version_id": 130072, "type": "LORA"}, {"hash": "..."}]}
+    DEFAULT_MANIFEST = 'models.manifest.json'
+
+    def __init__(self, api_handler, downloader, main_cli):
+        self.api_handler = api_handler
+        self.downloader = downloader
+        self.main_cli = main_cli
+
+    @staticmethod
+    def lockfile_path(manifest_path):
+        base_name, _ = os.path.splitext(manifest_path)
+        return f"{base_name}.lock.json"
+
+    @staticmethod
+    def entry_key(entry):
+        for key in ['version_id', 'model_id', 'hash']:
+            if entry.get(key):
+                return f"{key}:{str(entry[key]).lower()}"
+        return None
+
+    def resolve_entry(self, entry):
+        if entry.get('version_id'):
+            version = self.api_handler.get_model_version_by_id(entry['version_id'])
+        elif entry.get('hash'):
+            version = self.api_handler.get_model_by_hash(entry['hash'])
+        elif entry.get('model_id'):
+            model = self.api_handler.get_model_by_id(entry['model_id'])
+            model_versions = model.get('modelVersions', []) if model else []
+            if not model_versions:
+                return None
+            # The newest version comes first
+            version = dict(model_versions[0], modelId=model.get('id'), model={'name': model.get('name'), 'type': model.get('type')})
+        else:
+            return None
+        if not version:
+            return None
+
+        version_files = version.get('files', [])
+        file_info = (self.downloader.select_version_file(version_files) if version_files else None) or {}
+        return {
+            'key': self.entry_key(entry),
+            'model_id': version.get('modelId'),
+            'version_id': version.get('id'),
+            'name': version.get('model', {}).get('name'),
+            'type': entry.get('type') or version.get('model', {}).get('type', 'Unknown'),
+            'filename': file_info.get('name'),
+            'sha256': (file_info.get('hashes', {}).get('SHA256') or '').lower(),
+            'sizeKB': file_info.get('sizeKB')
+        }
+
+    def resolve(self, manifest_path, workers):
+        with open(manifest_path, 'rb') as f:
+            manifest_hash = hashlib.sha256(f.read()).hexdigest()
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        entries = manifest.get('models', [])
+
+        # Reuse the lockfile while the manifest is unchanged so every node gets the same versions
+        lockfile_path = self.lockfile_path(manifest_path)
+        if os.path.exists(lockfile_path):
+            try:
+                with open(lockfile_path, 'r') as f:
+                    lock = json.load(f)
+            except (OSError, ValueError):
+                lock = {}  # A damaged lockfile is resolved again
+            if isinstance(lock, dict) and lock.get('manifest_sha256') == manifest_hash:
+                print(colored(f"🔒 Using resolved versions from {lockfile_path}", "cyan"))
+                return lock.get('models', [])
+
+        print(colored(f"🔍 Resolving {len(entries)} manifest entries...", "cyan"))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            resolved = list(executor.map(self.resolve_entry, entries))
+        for entry, resolved_entry in zip(entries, resolved):
+            if resolved_entry is None:
+                print(colored(f"  🚫 Could not resolve manifest entry {entry}", "red"))
+        resolved = [resolved_entry for resolved_entry in resolved if resolved_entry]
+
+        with open(lockfile_path, 'w') as f:
+            json.dump({'manifest_sha256': manifest_hash, 'models': resolved}, f, indent=4)
+        print(colored(f"🔒 Wrote {lockfile_path}", "cyan"))
+        return resolved
+
+    def missing_entries(self, resolved):
+        model_index = self.main_cli.load_model_index()
+        indexed_version_ids = {str(model.get('modelversionid')) for model in model_index.values()}
+        indexed_hashes = {model.get('hash').lower() for model in model_index.values() if model.get('hash')}
+        return [
+            entry for entry in resolved
+            if str(entry['version_id']) not in indexed_version_ids and entry['sha256'] not in indexed_hashes
+        ]
+
+    @staticmethod
+    def validate_manifest(manifest):
+        if not isinstance(manifest, dict):
+            return "the manifest must be a JSON object"
+        if not isinstance(manifest.get('models', []), list) or not all(isinstance(entry, dict) for entry in manifest.get('models', [])):
+            return "'models' must be a list of objects"
+        workers = manifest.get('workers', 4)
+        if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+            return "'workers' must be a positive integer"
+        return None
+
+    def verify_entry(self, entry, file_path):
+        # Compare the download with the hash pinned in the lockfile
+        if not entry.get('sha256') or not os.path.isfile(file_path):
+            return True
+        if self.downloader.generate_sha256(file_path) == entry['sha256']:
+            return True
+        print(colored(f"⚠️ SHA-256 of {entry['filename']} does not match the lockfile. Removing it.", "red"))
+        os.remove(file_path)
+        def remove_file(model_hashes):
+            for key, model in list(model_hashes.items()):
+                if model.get('filepath') and os.path.abspath(model['filepath']) == os.path.abspath(file_path):
+                    del model_hashes[key]
+        self.main_cli.index.update(remove_file).result()
+        return False
+
+    def sync(self, manifest_path=DEFAULT_MANIFEST):
+        if not os.path.exists(manifest_path):
+            print(colored(f"🚫 Manifest {manifest_path} not found.", "red"))
+            return
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(colored(f"🚫 Could not read manifest {manifest_path}: {e}", "red"))
+            return
+        error = self.validate_manifest(manifest)
+        if error:
+            print(colored(f"🚫 Invalid manifest {manifest_path}: {error}", "red"))
+            return
+        workers = manifest.get('workers', 4)
+
+        resolved = self.resolve(manifest_path, workers)
+        missing = self.missing_entries(resolved)
+        print(colored(f"📋 {len(resolved)} models in manifest, {len(resolved) - len(missing)} present, {len(missing)} missing.", "yellow"))
+        if not missing:
+            print(colored("✅ Library is in sync with the manifest.", "green"))
+            return
+
+        failed_verification = []
+
+        def download_entry(entry):
+            print(f"⬇️ Downloading {entry['name']} ({entry['filename']}, version {entry['version_id']})")
+            download_path = self.downloader.get_download_path(entry['type'])
+            file_path = os.path.join(download_path, entry['filename'] or '')
+            # Files that were already there are left alone, only new downloads are checked
+            existed = bool(entry['filename']) and os.path.exists(file_path)
+            self.downloader.download_model_by_id(entry['version_id'], download_path, entry['type'], silent=True)
+            if entry['filename'] and not existed and not self.verify_entry(entry, file_path):
+                failed_verification.append(entry)
+
+        missing = self.downloader.schedule_downloads(missing)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(download_entry, missing))
+
+        still_missing = self.missing_entries(resolved)
+        still_missing += [entry for entry in failed_verification if entry not in still_missing]
+        if still_missing:
+            print(colored(f"⚠️ {len(still_missing)} models could not be synced: {', '.join(str(entry['version_id']) for entry in still_missing)}", "red"))
+        else:
+            print(colored("✅ Library is in sync with the manifest.", "green"))
+
+class BatchCLI:
+    # Non-interactive subcommands: IDs, hashes or paths come from the arguments or stdin,
+    # results are written to stdout as JSON lines and all other output goes to stderr
+    def __init__(self, args, components=None, record_sink=None, inputs=None):
+        # The daemon passes its warm components, a sink for the records and the client's stdin
+        self.args = args
+        self.output = sys.stdout
+        self.output_lock = threading.Lock()
+        self.record_sink = record_sink
+        self.inputs = inputs
+        self.failures = 0
+        self.shared = components is not None
+        if components is None:
+            with redirect_stdout(sys.stderr):
+                components = self.create_components(getattr(args, 'root', None))
+        self.model_display, self.api_handler, self.settings_cli, self.downloader, self.main_cli = components
+        profiler.instrument(self.main_cli)
+
+    @staticmethod
+    def create_components(root_directory=None, cache_ttl=0):
+        model_display = ModelDisplay(text_only=True)
+        api_handler = APIHandler(cache_ttl=cache_ttl)
+        settings_cli = SettingsCLI(api_handler, model_display)
+        if root_directory:
+            settings_cli.root_directory = root_directory
+        downloader = Downloader(api_handler, settings_cli, None, settings_cli.root_directory)
+        main_cli = MainCLI(model_display, settings_cli, downloader)
+        main_cli.quiet_scans = True
+        downloader.main_cli = main_cli
+        return model_display, api_handler, settings_cli, downloader, main_cli
+
+    @staticmethod
+    def build_parser():
+        parser = argparse.ArgumentParser(description="CivitAI-CLI. Without a command the interactive menu starts.")
+        parser.add_argument('--debug', action='store_true', help="Print startup phase timings")
+        parser.add_argument('--no-daemon', action='store_true', help="Do not use a running daemon")
+        parser.add_argument('--socket', default=CivitAIDaemon.DEFAULT_SOCKET, help="Daemon socket path")
+        parser.add_argument('--profile', metavar='DIR', help="Write a cProfile of every action and a summary of the hottest functions to DIR")
+        subparsers = parser.add_subparsers(dest='command')
+
+        subparsers.add_parser('daemon', help="Keep the index, HTTP sessions, caches and the download queue warm for other invocations")
+
+        list_parser = subparsers.add_parser('list', help="List models matching a query")
+        list_parser.add_argument('--query', help="Search term")
+        list_parser.add_argument('--type', dest='types', help="Model type, e.g. LORA")
+        list_parser.add_argument('--sort', choices=SettingsCLI.SORT_OPTIONS)
+        list_parser.add_argument('--limit', type=int, default=20)
+        list_parser.add_argument('--page', type=int, default=1)
+        list_parser.add_argument('--default-query', action='store_true', help="Start from the saved default query")
+
+        get_parser = subparsers.add_parser('get', help="Fetch models, versions or hashes")
+        get_parser.add_argument('--by', choices=['model', 'version', 'hash'], default='model')
+        get_parser.add_argument('ids', nargs='*', help="IDs or hashes, read from stdin when omitted")
+
+        download_parser = subparsers.add_parser('download', help="Download model versions")
+        download_parser.add_argument('--root', help="Override the root directory")
+        download_parser.add_argument('ids', nargs='*', help="Version IDs, read from stdin when omitted")
+
+        scan_parser = subparsers.add_parser('scan', help="Rescan the model folders and print the index")
+        scan_parser.add_argument('--root', help="Override the root directory")
+        scan_parser.add_argument('--hash', action='store_true', help="Also hash files that were only identified from their header")
+
+        verify_parser = subparsers.add_parser('verify', help="Check files against their recorded SHA-256")
+        verify_parser.add_argument('--workers', type=int, default=4)
+        verify_parser.add_argument('paths', nargs='*', help="Model files, every indexed file when omitted")
+
+        metadata_parser = subparsers.add_parser('metadata', help="Write .civitai.info, .json and .preview.png sidecars")
+        metadata_parser.add_argument('--root', help="Override the root directory")
+        metadata_parser.add_argument('paths', nargs='*', help="Model files, every indexed model when omitted")
+
+        subparsers.add_parser('metrics', help="Print the collected metrics as JSON, those of the daemon when one is running")
+        return parser
+
+    def emit(self, record):
+        with self.output_lock:
+            if self.record_sink:
+                self.record_sink(record)
+            else:
+                self.output.write(json.dumps(record) + '\n')
+                self.output.flush()
+            if 'error' in record:
+                self.failures += 1
+
+    def read_inputs(self, values):
+        if values:
+            return values
+        if self.inputs is not None:
+            return self.inputs
+        if sys.stdin.isatty():
+            return []
+        return sys.stdin.read().split()
+
+    def run(self):
+        command = profiler.wrap(getattr(self, f"command_{self.args.command}"), f"batch_{self.args.command}")
+        if self.shared:
+            # The daemon already sends its own output to stderr
+            command()
+        else:
+            with redirect_stdout(sys.stderr):
+                command()
+                self.downloader.preview_pipeline.wait()
+        return 1 if self.failures else 0
+
+    def command_list(self):
+        default_query = dict(self.model_display.default_query) if self.args.default_query else {}
+        override = {'limit': self.args.limit, 'page': self.args.page}
+        if self.args.query:
+            override['query'] = self.args.query
+        if self.args.types:
+            override['types'] = self.args.types
+        if self.args.sort:
+            override['sort'] = self.args.sort
+        models, metadata = self.api_handler.get_models_with_default_query(default_query, override)
+        if models is None:
+            self.emit({'error': metadata.get('error')})
+            return
+        for model in models:
+            self.emit(model)
+
+    def command_get(self):
+        api_method = {
+            'model': self.api_handler.get_model_by_id,
+            'version': self.api_handler.get_model_version_by_id,
+            'hash': self.api_handler.get_model_by_hash,
+        }[self.args.by]
+        values = self.read_inputs(self.args.ids)
+        rate_limiter = RateLimiter(5)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for value, result in zip(values, executor.map(lambda value: self.downloader.call_api(rate_limiter, api_method, value), values)):
+                self.emit(result if result is not None else {self.args.by: value, 'error': 'not found'})
+
+    def command_download(self):
+        version_ids = []
+        for value in self.read_inputs(self.args.ids):
+            if str(value).isdigit():
+                version_ids.append(int(value))
+            else:
+                self.emit({'version_id': value, 'error': 'invalid version ID'})
+        jobs = self.downloader.schedule_downloads([{'version_id': version_id} for version_id in version_ids])
+        accepted_ids = {job['version_id'] for job in jobs}
+        for version_id in version_ids:
+            if version_id not in accepted_ids:
+                self.emit({'version_id': version_id, 'error': 'InsufficientSpace'})
+
+        def download(job):
+            failed = []
+            try:
+                downloaded = self.downloader.download_model_by_id(job['version_id'], self.downloader.get_download_path(job['type']), job['type'], silent=True, failed_downloads_list=failed)
+            except Exception as e:
+                # One broken job must not abort the batch, the others still get their records
+                failed.append({'type': job['type'], 'version_id': job['version_id'], 'error': f"{type(e).__name__}: {e}"})
+                downloaded = False
+            for entry in failed:
+                self.downloader.failed_downloads_list.append(entry)  # Keep them for the retry worker of the menu
+            if not downloaded:
+                self.emit({'version_id': job['version_id'], 'type': job['type'], 'error': str(failed[-1].get('error')) if failed else 'NotDownloaded'})
+            else:
+                self.emit({'version_id': job['version_id'], 'type': job['type'], 'status': 'downloaded'})
+
+        # Same policy as the menu: only the aria2c daemon multiplexes parallel downloads
+        max_workers = 8 if self.settings_cli.download_backend == 'rpc' else 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(download, jobs))
+        if self.downloader.aria2_rpc and not self.shared:
+            self.downloader.aria2_rpc.shutdown()
+
+    def command_scan(self):
+        self.main_cli.scan_directory_for_models(self.settings_cli.root_directory)
+        if self.args.hash:
+            self.main_cli.hash_pending_models()
+        for key, model in self.main_cli.load_model_index().items():
+            self.emit(dict(model, key=key))
+
+    def indexed_files(self):
+        return [model for model in self.main_cli.model_index.values() if model.get('filepath') and not model.get('extracted_files')]
+
+    def command_verify(self):
+        paths = self.read_inputs(self.args.paths)
+        if paths:
+            by_path = {model['filepath']: model for model in self.indexed_files()}
+            files = [(os.path.abspath(path), by_path.get(os.path.abspath(path), {}).get('hash')) for path in paths]
+        else:
+            files = [(model['filepath'], model.get('hash')) for model in self.indexed_files()]
+
+        def verify(file):
+            file_path, expected_hash = file
+            if not os.path.exists(file_path):
+                return {'filepath': file_path, 'error': 'missing'}
+            file_hash = self.downloader.generate_sha256(file_path)
+            if not expected_hash:
+                return {'filepath': file_path, 'sha256': file_hash, 'status': 'unknown'}
+            if file_hash.lower() != expected_hash.lower():
+                return {'filepath': file_path, 'sha256': file_hash, 'expected': expected_hash.lower(), 'error': 'mismatch'}
+            return {'filepath': file_path, 'sha256': file_hash, 'status': 'ok'}
+
+        with ThreadPoolExecutor(max_workers=self.args.workers) as executor:
+            for record in executor.map(verify, files):
+                self.emit(record)
+
+    def command_metadata(self):
+        paths = self.read_inputs(self.args.paths)
+        if not paths:
+            refreshed, failed = self.downloader.refresh_all_metadata()
+            model_index = self.main_cli.load_model_index()
+            for key, model_version_details in refreshed:
+                self.emit({'filepath': model_index.get(key, {}).get('filepath'), 'model_id': model_version_details.get('modelId'),
+                           'version_id': model_version_details.get('id'), 'status': 'refreshed'})
+            for file_path, reason in failed:
+                self.emit({'filepath': file_path, 'error': reason})
+            return
+
+        indexed_hashes = {model['filepath']: model.get('hash') for model in self.indexed_files()}
+        for path in paths:
+            file_path = os.path.abspath(path)
+            if not os.path.exists(file_path):
+                self.emit({'filepath': file_path, 'error': 'missing'})
+                continue
+            file_hash = indexed_hashes.get(file_path) or self.downloader.generate_sha256(file_path)
+            base_name = os.path.splitext(os.path.basename(file_path))[0]
+            model_version_details = self.downloader.download_metadata_by_hash(file_hash, os.path.dirname(file_path), base_name)
+            if model_version_details is None:
+                self.emit({'filepath': file_path, 'sha256': file_hash, 'error': 'not found'})
             else:
-                print(f"Failed to download image from {image_url}.")
+                self.emit({'filepath': file_path, 'model_id': model_version_details.get('modelId'),
+                           'version_id': model_version_details.get('id'), 'status': 'refreshed'})
+
+    def command_metrics(self):
+        self.emit(metrics.to_json())
+
+class DaemonError(Exception):
+    pass
+
+class DaemonClient:
+    # Newline-delimited JSON-RPC 2.0 over the daemon's Unix socket. Batch commands
+    # stream their JSON lines back as "record" notifications before the response.
+    def __init__(self, sock, socket_path=None):
+        self.sock = sock
+        self.socket_path = socket_path
+        self.rfile = sock.makefile('rb')
+        self.lock = threading.Lock()
+        self.request_id = 0
+
+    @classmethod
+    def connect(cls, socket_path=None):
+        socket_path = socket_path or CivitAIDaemon.DEFAULT_SOCKET
+        if not os.path.exists(socket_path):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+            return None  # Stale socket of a daemon that is gone
+        return cls(sock, socket_path)
+
+    def open_connection(self):
+        # Long running commands get a connection of their own, so calls on this one don't queue behind them
+        return DaemonClient.connect(self.socket_path)
+
+    def call(self, method, params=None, on_record=None):
+        # One request at a time per connection: the response follows its streamed records
+        with self.lock:
+            self.request_id += 1
+            request = {'jsonrpc': '2.0', 'id': self.request_id, 'method': method, 'params': params or {}}
+            self.sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            for line in self.rfile:
+                message = json.loads(line)
+                if message.get('method') == 'record':
+                    if on_record:
+                        on_record(message['params'])
+                    continue
+                if 'error' in message:
+                    raise DaemonError(message['error'].get('message'))
+                return message.get('result')
+            raise DaemonError("Daemon closed the connection")
+
+    def run(self, args, inputs=None, on_record=None):
+        def print_record(record):
+            sys.stdout.write(json.dumps(record) + '\n')
+            sys.stdout.flush()
+        result = self.call('run', {'args': args, 'inputs': inputs}, on_record=on_record or print_record)
+        return result['exit_code']
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+class DaemonAPIHandler(APIHandler):
+    # Lets the menu share the daemon's HTTP session and API cache
+    def __init__(self, daemon_client):
+        super().__init__()
+        self.daemon_client = daemon_client
+
+    def call_api(self, name, *args):
+        # Callers handle API failures as requests exceptions, wherever the request was made
+        try:
+            return self.daemon_client.call('api', {'name': name, 'args': list(args)})
+        except (DaemonError, OSError) as e:
+            raise requests.exceptions.RequestException(f"Daemon API call {name} failed: {e}") from e
+
+    def get_models_with_default_query(self, default_query_dict, override_query_dict=None):
+        models, metadata = self.call_api('get_models_with_default_query', default_query_dict, override_query_dict)
+        return models, metadata
+
+    def get_model_by_id(self, model_id):
+        return self.call_api('get_model_by_id', model_id)
+
+    def get_model_version_by_id(self, version_id):
+        return self.call_api('get_model_version_by_id', version_id)
+
+    def get_model_by_hash(self, hash_value):
+        return self.call_api('get_model_by_hash', hash_value)
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                self.send({'jsonrpc': '2.0', 'id': None, 'error': {'code': -32700, 'message': 'Parse error'}})
+                continue
+            self.server.daemon.dispatch(request, self.send)
+
+    def send(self, message):
+        self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+class CivitAIDaemon:
+    # Holds the index, the HTTP session, the API cache and the download queue in one process
+    # Absolute, so clients started from any directory find the daemon
+    DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), f"civitai-cli-{os.getuid()}.sock" if hasattr(os, 'getuid') else 'civitai-cli.sock')
+    API_METHODS = ['get_models_with_default_query', 'get_model_by_id', 'get_model_version_by_id', 'get_model_by_hash']
+
+    def __init__(self, socket_path=None, cache_ttl=300):
+        self.socket_path = socket_path or self.DEFAULT_SOCKET
+        self.started_at = time.time()
+        self.components = BatchCLI.create_components(cache_ttl=cache_ttl)
+        profiler.instrument(self.components[4])
+        self.api_handler = self.components[1]
+        self.downloader = self.components[3]
+        self.main_cli = self.components[4]
+
+    def dispatch(self, request, send):
+        request_id = request.get('id')
+        params = request.get('params') or {}
+        try:
+            method = request.get('method')
+            if method == 'ping':
+                result = {'pid': os.getpid(), 'uptime': time.time() - self.started_at, 'indexed_models': len(self.main_cli.model_index)}
+            elif method == 'api':
+                if params.get('name') not in self.API_METHODS:
+                    raise DaemonError(f"Unknown API method: {params.get('name')}")
+                result = getattr(self.api_handler, params['name'])(*params.get('args', []))
+            elif method == 'index':
+                result = dict(self.main_cli.model_index)
+            elif method == 'scan':
+                result = self.main_cli.scan_directory_for_models(params.get('directory') or self.components[2].root_directory)
+            elif method == 'metrics':
+                result = metrics.to_json()
+            elif method == 'run':
+                args = argparse.Namespace(**params['args'])
+                if getattr(args, 'root', None):
+                    raise DaemonError("--root cannot be changed on a running daemon, use --no-daemon")
+                sink = lambda record: send({'jsonrpc': '2.0', 'method': 'record', 'params': record})
+                batch_cli = BatchCLI(args, components=self.components, record_sink=sink, inputs=params.get('inputs'))
+                result = {'exit_code': batch_cli.run()}
+            elif method == 'shutdown':
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                result = True
+            else:
+                send({'jsonrpc': '2.0', 'id': request_id, 'error': {'code': -32601, 'message': f"Method not found: {method}"}})
+                return
+        except Exception as e:
+            send({'jsonrpc': '2.0', 'id': request_id, 'error': {'code': -32000, 'message': f"{type(e).__name__}: {e}"}})
+            return
+        send({'jsonrpc': '2.0', 'id': request_id, 'result': result})
+
+    def serve(self):
+        if DaemonClient.connect(self.socket_path):
+            print(f"A daemon is already listening on {self.socket_path}")
+            return 1
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)  # Left behind by a daemon that did not shut down cleanly
+        self.downloader.start_retry_worker()
+        self.main_cli.start_hash_worker()
+        self.main_cli.start_background_scan(self.components[2].root_directory)
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, DaemonRequestHandler)
+        self.server.daemon_threads = True
+        self.server.daemon = self
+        print(f"🛰️ Daemon listening on {self.socket_path} (pid {os.getpid()})")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self.downloader.preview_pipeline.wait()
+            if self.downloader.aria2_rpc:
+                self.downloader.aria2_rpc.shutdown()
+        return 0
+
+HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+
+class ThumbnailCache:
+    # Size-bounded LRU cache of resized card images, keyed by image URL and display size
+    PIXELS_PER_ROW = 10  # Thumbnail width in pixels per terminal row of display size
+
+    def __init__(self, directory=None, max_bytes=200 * 1024 * 1024):
+        self.directory = directory or os.path.join(os.path.expanduser("~"), '.cache', 'civitai-cli', 'thumbnails')
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def reduced_width_url(image_url, width):
+        # The CivitAI image CDN serves resized variants via a width=<px> path segment
+        return re.sub(r'/(width=\d+|original=true)/', f'/width={width}/', image_url, count=1)
+
+    def get_image(self, image_url, display_size):
+        key = hashlib.sha256(f"{image_url}|{display_size}".encode('utf-8')).hexdigest()
+        thumbnail_path = os.path.join(self.directory, f"{key}.png")
+        try:
+            with open(thumbnail_path, 'rb') as f:
+                image_data = f.read()
+            os.utime(thumbnail_path)  # Mark as recently used
+            metrics.record_cache_lookup('thumbnail', True)
+            return image_data
+        except FileNotFoundError:
+            metrics.record_cache_lookup('thumbnail', False)
+
+        width = display_size * self.PIXELS_PER_ROW
+        response = requests.get(self.reduced_width_url(image_url, width), timeout=10)
+        response.raise_for_status()
+        with Image.open(io.BytesIO(response.content)) as img:
+            img.thumbnail((width, width * 4))
+            if img.mode not in ('RGB', 'RGBA', 'L', 'P'):
+                img = img.convert('RGB')
+            buffer = io.BytesIO()
+            img.save(buffer, format='PNG')
+        image_data = buffer.getvalue()
+
+        temp_path = f"{thumbnail_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(image_data)
+        os.replace(temp_path, thumbnail_path)
+        self.evict()
+        return image_data
+
+    def evict(self):
+        entries = []
+        total_bytes = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+        # Drop the least recently used thumbnails first
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+class TerminalImageRenderer:
+    # Renders images in-process: graphics protocols for kitty/iTerm2, otherwise
+    # half-block characters with truecolor or 256-color escapes (two pixels per cell)
+    CORRECTION_FACTOR = 1.9  # Terminal cells are roughly twice as tall as wide
+    BLOCKIFY_FACTOR = 8  # Pixel size of the coarse mosaic used for blockified images
+    NUMBERS = None  # Decimal strings of 0-255, built on first render
+
+    def fit_cells(self, width, height, rows):
+        columns = max(1, int(rows * width / height * self.CORRECTION_FACTOR))
+        max_columns = shutil.get_terminal_size().columns
+        if columns > max_columns:
+            rows = max(1, int(rows * max_columns / columns))
+            columns = max_columns
+        return columns, rows
+
+    def render(self, image_data, rows, terminal_type, blockify=False):
+        with Image.open(io.BytesIO(image_data)) as img:
+            columns, rows = self.fit_cells(img.width, img.height, rows)
+            if terminal_type == 'image' and not blockify:
+                return self.render_graphics(image_data, columns, rows)
+            img = img.convert('RGB')
+            if blockify:
+                # Mosaic the image so blockified content stays unrecognizable
+                img = img.resize((max(1, columns // self.BLOCKIFY_FACTOR), max(1, rows * 2 // self.BLOCKIFY_FACTOR)), Image.BILINEAR)
+            pixels = np.asarray(img.resize((columns, rows * 2), Image.NEAREST if blockify else Image.LANCZOS), dtype=np.uint8)
+        if terminal_type == 'ascii':
+            return self.render_256_color(pixels)
+        return self.render_truecolor(pixels)
 
-        print(f"Successfully downloaded and saved metadata for {model_name}.")
+    @staticmethod
+    def render_graphics(image_data, columns, rows):
+        with Image.open(io.BytesIO(image_data)) as img:
+            if img.format != 'PNG':
+                buffer = io.BytesIO()
+                img.save(buffer, format='PNG')
+                image_data = buffer.getvalue()
+        payload = base64.standard_b64encode(image_data).decode('ascii')
+        if os.getenv("TERM", "") == "xterm-kitty":
+            # Kitty graphics protocol, sent in chunks of at most 4096 bytes
+            chunks = [payload[i:i + 4096] for i in range(0, len(payload), 4096)]
+            output = []
+            for index, chunk in enumerate(chunks):
+                more = 1 if index < len(chunks) - 1 else 0
+                control = f"a=T,f=100,c={columns},r={rows},m={more}" if index == 0 else f"m={more}"
+                output.append(f"\033_G{control};{chunk}\033\\")
+            return ''.join(output)
+        # iTerm2 inline images
+        return f"\033]1337;File=inline=1;width={columns};height={rows};preserveAspectRatio=0:{payload}\a"
+
+    @classmethod
+    def numbers(cls):
+        if cls.NUMBERS is None:
+            cls.NUMBERS = np.array([str(i) for i in range(256)], dtype=object)
+        return cls.NUMBERS
+
+    def render_truecolor(self, pixels):
+        top, bottom = pixels[0::2], pixels[1::2]
+        numbers = self.numbers()
+        cells = ('\033[38;2;' + numbers[top[..., 0]] + ';' + numbers[top[..., 1]] + ';' + numbers[top[..., 2]]
+                 + 'm\033[48;2;' + numbers[bottom[..., 0]] + ';' + numbers[bottom[..., 1]] + ';' + numbers[bottom[..., 2]] + 'm▀')
+        return '\n'.join(''.join(row) + '\033[0m' for row in cells)
+
+    def render_256_color(self, pixels):
+        # Map every pixel to the closest entry of the xterm 6x6x6 color cube
+        levels = (pixels.astype(np.uint16) * 5 + 127) // 255
+        palette = 16 + 36 * levels[..., 0] + 6 * levels[..., 1] + levels[..., 2]
+        top, bottom = palette[0::2], palette[1::2]
+        numbers = self.numbers()
+        cells = '\033[38;5;' + numbers[top] + 'm\033[48;5;' + numbers[bottom] + 'm▀'
+        return '\n'.join(''.join(row) + '\033[0m' for row in cells)
 
 class ModelDisplay:
     def __init__(self, size='medium', text_only=False):
         self.size = size  # 'small', 'medium', 'large'
         self.text_only = text_only
+        self.use_pager = False
         self.terminal_type = self._detect_terminal_type()
         self.size_mapping = self._get_size_mapping()
+        # The thumbnail cache directory and the image pool are only created once a card is shown,
+        # batch commands and the daemon never render
+        self._thumbnail_cache = None
+        self.image_renderer = TerminalImageRenderer()
+        self._image_executor = None
+        self.prefetched_images = {}  # image URL -> Future of the thumbnail data
+
+    @property
+    def thumbnail_cache(self):
+        if self._thumbnail_cache is None:
+            self._thumbnail_cache = ThumbnailCache()
+        return self._thumbnail_cache
+
+    @property
+    def image_executor(self):
+        if self._image_executor is None:
+            self._image_executor = ThreadPoolExecutor(max_workers=16)
+        return self._image_executor
 
     def _detect_terminal_type(self):
         term = os.getenv("TERM", "")
@@ -1344,6 +4115,51 @@ class ModelDisplay:
     def get_display_size(self):
         return self.size_mapping.get(self.size, 40)
 
+    @staticmethod
+    def html_to_text(html_content):
+        return html.unescape(HTML_TAG_PATTERN.sub('', html_content))
+
+    @staticmethod
+    def join_lines(lines):
+        return '\n'.join(lines) + '\n'
+
+    def write_output(self, text):
+        # One write per card or page instead of one per line
+        # less -R only passes color codes through, kitty/iTerm2 images would come out as garbage
+        has_graphics = self.terminal_type == 'image' and ('\033_G' in text or '\033]1337;' in text)
+        if self.use_pager and not has_graphics and text.count('\n') > shutil.get_terminal_size().lines and shutil.which('less'):
+            pydoc.pipepager(text, 'less -R')
+        else:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    @staticmethod
+    def get_card_image_url(model):
+        model_versions = model.get('modelVersions', [])
+        images = model_versions[0].get('images', []) if model_versions else []
+        return images[0].get('url', 'N/A') if images else 'N/A'
+
+    def prefetch_images(self, models, image_filter_settings):
+        self.prefetched_images = {}
+        if self.text_only:
+            return
+        display_size = self.get_display_size()
+        ensure_imported(requests, Image)
+        for model in models:
+            image_url = self.get_card_image_url(model)
+            images = [image for version in model.get('modelVersions', []) for image in version.get('images', [])]
+            # Skip cards whose images would all be blocked anyway
+            if image_url == 'N/A' or all(image_filter_settings.get(image.get('nsfw', 'None'), 'allow') == 'block' for image in images):
+                continue
+            if image_url not in self.prefetched_images:
+                self.prefetched_images[image_url] = self.image_executor.submit(self.thumbnail_cache.get_image, image_url, display_size)
+
+    def get_image_data(self, image_url):
+        future = self.prefetched_images.pop(image_url, None)
+        if future is not None:
+            return future.result()  # Re-raises any error of the prefetch
+        return self.thumbnail_cache.get_image(image_url, self.get_display_size())
+
     @staticmethod
     def convert_size(size_kb):
         if size_kb >= 1000000:  # Greater than or equal to 1000 MB
@@ -1365,6 +4181,10 @@ class ModelDisplay:
             return '\033[91m'  # Light Red
 
     def display_model_card(self, model, image_filter, download_status, image_filter_settings):
+        self.write_output(self.render_model_card(model, image_filter, download_status, image_filter_settings))
+
+    def render_model_card(self, model, image_filter, download_status, image_filter_settings):
+        lines = []
         nsfw_status = None
         action = image_filter_settings.get(nsfw_status, 'allow')
         model_name = model.get('name', 'N/A')
@@ -1372,22 +4192,22 @@ class ModelDisplay:
         padding_length = (total_length - len(model_name)) // 2  
         reset_color = '\033[0m\033[49m'
         separator = f"{'.' * padding_length}\033[1m{model_name}\033[0m{'.' * (total_length - len(model_name) - padding_length)}"
-        print(separator)
-        print()
+        lines.append(separator)
+        lines.append('')
 
         # Print Basic Info
-        print(f"🆔 ID: {model.get('id', 'N/A')}")
+        lines.append(f"🆔 ID: {model.get('id', 'N/A')}")
         base_url = "https://civitai.com/models/"
         model_id = model.get('id', 'N/A')
         full_url = f"{base_url}{model_id}"
-        print(f"🌐 URL: \033[94m\033[4m{full_url}\033[0m")
-        print(f"📛 Name: {model.get('name', 'N/A')}")
-        print(f"👤 Creator: {model.get('creator', {}).get('username', 'N/A')}")
-        print(f"🤖 Type: {model.get('type', 'N/A')}")
+        lines.append(f"🌐 URL: \033[94m\033[4m{full_url}\033[0m")
+        lines.append(f"📛 Name: {model.get('name', 'N/A')}")
+        lines.append(f"👤 Creator: {model.get('creator', {}).get('username', 'N/A')}")
+        lines.append(f"🤖 Type: {model.get('type', 'N/A')}")
 
         # Print download status
         if download_status:
-            print(f"📥 Download Status: {download_status}")
+            lines.append(f"📥 Download Status: {download_status}")
         model_versions = model.get('modelVersions', [])
         if model_versions:
             base_models = set(version.get('baseModel', 'N/A') for version in model_versions)
@@ -1410,34 +4230,26 @@ class ModelDisplay:
             virus_scan_color = self.get_scan_color('N/A')
             scanned_at = 'N/A'
 
-        print(f"🛠️ Base Models: {base_models_str}")
-        print(f"⭐ Rating: {model.get('stats', {}).get('rating', 'N/A')}")
-        print(f"🔞 NSFW: {model.get('nsfw', 'N/A')}")
-        print(f"🏷️ Tags: {', '.join(model.get('tags', ['N/A']))}")
-        print(f"📦 File Size: \033[1m{size_kb}\033[0m")
-        print("\n-- Scans --")
-        print(f"🐍 Pickle Scan: {pickle_scan_color}{pickle_scan}{reset_color}")
-        print(f"🔬 Virus Scan: {virus_scan_color}{virus_scan}{reset_color}")
-        print(f"🗓️ Scanned At: {scanned_at}")
-        print("\n-- Description --")
+        lines.append(f"🛠️ Base Models: {base_models_str}")
+        lines.append(f"⭐ Rating: {model.get('stats', {}).get('rating', 'N/A')}")
+        lines.append(f"🔞 NSFW: {model.get('nsfw', 'N/A')}")
+        lines.append(f"🏷️ Tags: {', '.join(model.get('tags', ['N/A']))}")
+        lines.append(f"📦 File Size: \033[1m{size_kb}\033[0m")
+        lines.append("\n-- Scans --")
+        lines.append(f"🐍 Pickle Scan: {pickle_scan_color}{pickle_scan}{reset_color}")
+        lines.append(f"🔬 Virus Scan: {virus_scan_color}{virus_scan}{reset_color}")
+        lines.append(f"🗓️ Scanned At: {scanned_at}")
+        lines.append("\n-- Description --")
         raw_description = model.get('description', '')
         if raw_description:
-            stripped_description = re.sub('<.*?>', '', raw_description)
+            stripped_description = self.html_to_text(raw_description)
             truncated_description = (stripped_description[:200] + '...') if len(stripped_description) > 200 else stripped_description
         else:
             truncated_description = 'N/A'
-        print(f"\n📝 Description: {truncated_description}\n")
-        print( )
+        lines.append(f"\n📝 Description: {truncated_description}\n")
+        lines.append('')
         # Safely fetch image URL
-        model_versions = model.get('modelVersions', [])
-        if model_versions:
-            images = model_versions[0].get('images', [])
-            if images:
-                image_url = images[0].get('url', 'N/A')
-            else:
-                image_url = 'N/A'
-        else:
-            image_url = 'N/A'
+        image_url = self.get_card_image_url(model)
 
         #print(f"Image URL: {image_url}")
         if not self.text_only:
@@ -1452,83 +4264,70 @@ class ModelDisplay:
                     
                     if action == 'block':
                         if not nsfw_warning_displayed:
-                            print(f"⚠️ {nsfw_status} content is blocked")
+                            lines.append(f"⚠️ {nsfw_status} content is blocked")
                             nsfw_warning_displayed = True
                         continue  
 
                     elif action == 'blockify':
-                        print(f"⚠️ {nsfw_status} content is blockified")
+                        lines.append(f"⚠️ {nsfw_status} content is blockified")
                  
                     # Image fetching and displaying logic
                     if image_url != 'N/A' and attempt_counter < 2:
                         try:
                             # Fetch and save the image data
-                            image_data = requests.get(image_url).content
+                            image_data = self.get_image_data(image_url)
                             image_format = imghdr.what(None, image_data)  
 
                             if image_format not in {"png", "jpeg", "gif"}:
                                 raise Image.UnidentifiedImageError("Unsupported image format")
                             
-                            with NamedTemporaryFile(suffix=f".{image_format}", delete=True) as temp_file:
-                                temp_file.write(image_data)
-                                temp_file.flush()
-
-                                with Image.open(temp_file.name) as img:
-                                    width, height = img.size
-
-                                aspect_ratio = width / height
-                                new_height = self.size_mapping.get(self.size, 80)  
-                                correction_factor = 1.9
-                                new_width = int(new_height * aspect_ratio * correction_factor)
-
-                                # If action is 'blockify', use the -b option in viu
-                                if action == 'blockify':
-                                    subprocess.run(["viu", "-b", "-w", str(new_width), "-h", str(new_height), temp_file.name])
-                                else:
-                                    subprocess.run(["viu", "-w", str(new_width), "-h", str(new_height), temp_file.name])
-
-                                return  
+                            new_height = self.size_mapping.get(self.size, 80)
+                            lines.append(self.image_renderer.render(image_data, new_height, self.terminal_type, blockify=(action == 'blockify')))
+                            return self.join_lines(lines)
 
                         except requests.RequestException:
-                            print(f"🚫 Failed to fetch image from {image_url}")
+                            lines.append(f"🚫 Failed to fetch image from {image_url}")
                         except Image.UnidentifiedImageError:
-                            print(f"🐟 Image from {image_url} not recognized")
+                            lines.append(f"🐟 Image from {image_url} not recognized")
                             attempt_counter += 1  # Increment attempt counter after a failed attempt
-                        except subprocess.CalledProcessError:
-                            print("⚠️ Failed to run viu")
                         except Exception as e:
-                            print(f"🚫 An unexpected error occurred: {str(e)}")
+                            lines.append(f"🚫 An unexpected error occurred: {str(e)}")
             # If the code reaches here, no image could be displayed
             if attempt_counter >= 2:
-                print("⚠️ Image could not be displayed after 2 attempts.")
+                lines.append("⚠️ Image could not be displayed after 2 attempts.")
             else:
-                print("⚠️ No image could be displayed")
-            print(".")
+                lines.append("⚠️ No image could be displayed")
+            lines.append(".")
+        return self.join_lines(lines)
 
 
     
     def display_model_version_details(self, model, image_filter_settings):
+        self.write_output(self.render_model_version_details(model, image_filter_settings))
+
+    def render_model_version_details(self, model, image_filter_settings):
+        lines = []
         correction_factor = 1.9
         model_name = model.get('name', 'N/A')
         total_length = 125  # Total length of the separator line
         padding_length = (total_length - len(model_name)) // 2  # Calculate padding for each side
         reset_color = '\033[0m\033[49m'
         separator = f"{'.' * padding_length}\033[1m{model_name}\033[0m{'.' * (total_length - len(model_name) - padding_length)}"
-        print(separator)
-        print()
-        print()
+        lines.append(separator)
+        lines.append('')
+        lines.append('')
 
-        print(f"🆔 ID: {model.get('id', 'N/A')}")
+        lines.append(f"🆔 ID: {model.get('id', 'N/A')}")
         
         # Construct and print the URL
         base_url = "https://civitai.com/models/"
         model_id = model.get('id', 'N/A')
         full_url = f"{base_url}{model_id}"
-        print(f"🌐 URL: \033[94m\033[4m{full_url}\033[0m")
+        lines.append(f"🌐 URL: \033[94m\033[4m{full_url}\033[0m")
         
-        print(f"📛 Name: {model.get('name', 'N/A')}")
-        print(f"👤 Creator: {model.get('creator', {}).get('username', 'N/A')}")
-        print(f"🤖 Type: {model.get('type', 'N/A')}")
+        lines.append(f"📛 Name: {model.get('name', 'N/A')}")
+        lines.append(f"👤 Creator: {model.get('creator', {}).get('username', 'N/A')}")
+        lines.append(f"🤖 Type: {model.get('type', 'N/A')}")
         # Fetch model versions to display base model information
         model_versions = model.get('modelVersions', [])
         if model_versions:
@@ -1552,34 +4351,26 @@ class ModelDisplay:
             virus_scan_color = self.get_scan_color('N/A')
             scanned_at = 'N/A'
 
-        print(f"🛠️ Base Models: {base_models_str}")
-        print(f"\n⭐ Rating: {model.get('stats', {}).get('rating', 'N/A')}")
-        print(f"🔞 NSFW: {model.get('nsfw', 'N/A')}")
-        print(f"🏷️ Tags: {model.get('tags', 'N/A')}")
-        print(f"📦 File Size: {size_kb}")
-        print(f"🐍 Pickle Scan: {pickle_scan_color}{pickle_scan}{reset_color}")
-        print(f"🔬 Virus Scan: {virus_scan_color}{virus_scan}{reset_color}")
-        print(f"🗓️ Scanned At: {scanned_at}")    
+        lines.append(f"🛠️ Base Models: {base_models_str}")
+        lines.append(f"\n⭐ Rating: {model.get('stats', {}).get('rating', 'N/A')}")
+        lines.append(f"🔞 NSFW: {model.get('nsfw', 'N/A')}")
+        lines.append(f"🏷️ Tags: {model.get('tags', 'N/A')}")
+        lines.append(f"📦 File Size: {size_kb}")
+        lines.append(f"🐍 Pickle Scan: {pickle_scan_color}{pickle_scan}{reset_color}")
+        lines.append(f"🔬 Virus Scan: {virus_scan_color}{virus_scan}{reset_color}")
+        lines.append(f"🗓️ Scanned At: {scanned_at}")
 
         raw_description = model.get('description', '')
         if raw_description:
-            stripped_description = re.sub('<.*?>', '', raw_description)
+            stripped_description = self.html_to_text(raw_description)
             truncated_description = (stripped_description[:500] + '...') if len(stripped_description) > 100 else stripped_description
         else:
             truncated_description = 'N/A'
         
-        print(f"\n📝 Description: {truncated_description}")
-        print( )
+        lines.append(f"\n📝 Description: {truncated_description}")
+        lines.append('')
         # Safely fetch image URL
-        model_versions = model.get('modelVersions', [])
-        if model_versions:
-            images = model_versions[0].get('images', [])
-            if images:
-                image_url = images[0].get('url', 'N/A')
-            else:
-                image_url = 'N/A'
-        else:
-            image_url = 'N/A'
+        image_url = self.get_card_image_url(model)
 
         #print(f"Image URL: {image_url}")
         if not self.text_only:
@@ -1594,54 +4385,37 @@ class ModelDisplay:
                     
                     if action == 'block':
                         if not nsfw_warning_displayed:
-                            print(f"⚠️ {nsfw_status} content is blocked")
+                            lines.append(f"⚠️ {nsfw_status} content is blocked")
                             nsfw_warning_displayed = True
                         continue  
 
                     elif action == 'blockify':
-                        print(f"⚠️ {nsfw_status} content is blockified")
+                        lines.append(f"⚠️ {nsfw_status} content is blockified")
                     
                     # Image fetching and displaying logic
                     if image_url != 'N/A':
                         try:
                             # Fetch and save the image data
-                            image_data = requests.get(image_url).content
+                            image_data = self.get_image_data(image_url)
                             image_format = imghdr.what(None, image_data)  
 
                             if image_format not in {"png", "jpeg", "gif"}:
                                 raise Image.UnidentifiedImageError("Unsupported image format")
                             
-                            with NamedTemporaryFile(suffix=f".{image_format}", delete=True) as temp_file:
-                                temp_file.write(image_data)
-                                temp_file.flush()
-
-                                with Image.open(temp_file.name) as img:
-                                    width, height = img.size
-
-                                aspect_ratio = width / height
-                                new_height = self.size_mapping.get(self.size, 80)  
-                                correction_factor = 1.9
-                                new_width = int(new_height * aspect_ratio * correction_factor)
-
-                                # If action is 'blockify', use the -b option in viu
-                                if action == 'blockify':
-                                    subprocess.run(["viu", "-b", "-w", str(new_width), "-h", str(new_height), temp_file.name])
-                                else:
-                                    subprocess.run(["viu", "-w", str(new_width), "-h", str(new_height), temp_file.name])
-
-                                return  
+                            new_height = self.size_mapping.get(self.size, 80)
+                            lines.append(self.image_renderer.render(image_data, new_height, self.terminal_type, blockify=(action == 'blockify')))
+                            return self.join_lines(lines)
 
                         except requests.RequestException:
-                            print(f"🚫 Failed to fetch image from {image_url}")
+                            lines.append(f"🚫 Failed to fetch image from {image_url}")
                         except Image.UnidentifiedImageError:
-                            print(f"🐟 Image from {image_url} not recognized")
-                        except subprocess.CalledProcessError:
-                            print("⚠️ Failed to run viu")
+                            lines.append(f"🐟 Image from {image_url} not recognized")
                         except Exception as e:
-                            print(f"🚫 An unexpected error occurred: {str(e)}")
+                            lines.append(f"🚫 An unexpected error occurred: {str(e)}")
             # If the code reaches here, no image could be displayed
-            print("⚠️ No image could be displayed")
-            print(".")        
+            lines.append("⚠️ No image could be displayed")
+            lines.append(".")
+        return self.join_lines(lines)
 
 
     def display_model_by_hash(self, model_by_hash):
@@ -1650,80 +4424,129 @@ class ModelDisplay:
         # ... more fields
 
 
-# Initialize classes
-model_display = ModelDisplay()  
-api_handler = APIHandler()
-settings_cli = SettingsCLI(api_handler, model_display)
-downloader = Downloader(api_handler, settings_cli, None, settings_cli.root_directory)  # Temporarily pass None for main_cli
-main_cli = MainCLI(model_display, settings_cli, downloader)  # Now that we have a downloader, we can create main_cli
-main_cli.scan_directory_for_models(settings_cli.root_directory)
-main_cli.load_model_index()
-downloader.main_cli = main_cli  # Now that we have main_cli, we can set it in downloader
-
-# Main loop
-while True:
-    choice = main_cli.main_menu()
-    #print(f"DEBUG: User choice = {choice}")
-    if choice == 'List models':
-        main_cli.list_models_menu()
-    elif choice == 'Fetch model by ID':
-        model_id = main_cli.fetch_model_by_id()
-        model = api_handler.get_model_by_id(model_id)
-        if model:
-            # Calculate the download status
-            downloaded_versions = []  # List to store downloaded versions
-            model_versions = model.get('modelVersions', [])
-            for index_model in main_cli.model_index.values():
-                if index_model['modelid'] == model_id:
-                    for version in model_versions:
-                        if index_model['modelversionid'] == version.get('id'):
-                            # This is a downloaded version
-                            downloaded_versions.append(version.get('name'))
-            download_status = None
-            if downloaded_versions:
-                # If downloaded versions were found
-                if len(downloaded_versions) < len(model_versions):
-                    # If there are more versions available than downloaded
-                    if len(downloaded_versions) == 1:
-                        download_status = f"{Fore.YELLOW}⚠️ MORE VERSIONS AVAILABLE. Version '{', '.join(downloaded_versions)}' is downloaded.{Style.RESET_ALL}"
-                    else:
-                        download_status = f"{Fore.YELLOW}⚠️ MORE VERSIONS AVAILABLE. Versions '{', '.join(downloaded_versions)}' are downloaded.{Style.RESET_ALL}"
-                else:
-                    # If all versions are downloaded
-                    if len(downloaded_versions) == 1:
-                        download_status = f"{Fore.GREEN}✅ ALL VERSIONS DOWNLOADED. Version '{', '.join(downloaded_versions)}' is downloaded.{Style.RESET_ALL}"
+if __name__ == "__main__":
+    args = BatchCLI.build_parser().parse_args()
+    profiler.configure(args.profile)
+    daemon_client = None if args.no_daemon or args.command == 'daemon' else DaemonClient.connect(args.socket)
+    if args.command == 'daemon':
+        with redirect_stdout(sys.stderr):
+            sys.exit(CivitAIDaemon(args.socket).serve())
+    if args.command:
+        if daemon_client:
+            # Thin client: the daemon runs the command against its warm state
+            command_args = {key: value for key, value in vars(args).items() if key not in ('debug', 'no_daemon', 'socket', 'profile')}
+            for key in ('paths', 'root'):
+                if command_args.get(key):
+                    command_args[key] = [os.path.abspath(path) for path in command_args[key]] if key == 'paths' else os.path.abspath(command_args[key])
+            inputs = None
+            if not command_args.get('ids') and not command_args.get('paths') and not sys.stdin.isatty():
+                inputs = sys.stdin.read().split()
+                if command_args['command'] in ('verify', 'metadata'):
+                    inputs = [os.path.abspath(path) for path in inputs]
+            try:
+                sys.exit(daemon_client.run(command_args, inputs))
+            except DaemonError as e:
+                print(f"Daemon error: {e}", file=sys.stderr)
+                sys.exit(1)
+        metrics.disable_export()  # Only the daemon and the interactive menu write the export files
+        sys.exit(BatchCLI(args).run())
+
+    if daemon_client:
+        metrics.disable_export()  # The daemon does the work and exports the metrics
+    # Initialize classes
+    model_display = ModelDisplay()  
+    api_handler = DaemonAPIHandler(daemon_client) if daemon_client else APIHandler()
+    settings_cli = SettingsCLI(api_handler, model_display)
+    downloader = Downloader(api_handler, settings_cli, None, settings_cli.root_directory)  # Temporarily pass None for main_cli
+    main_cli = MainCLI(model_display, settings_cli, downloader)  # Now that we have a downloader, we can create main_cli
+    downloader.main_cli = main_cli  # Now that we have main_cli, we can set it in downloader
+    main_cli.daemon_client = daemon_client
+    profiler.instrument(main_cli)
+    model_sync = ModelSync(api_handler, downloader, main_cli)
+    downloader.preview_pipeline.log_path = 'preview_images.log'
+    if not daemon_client:
+        # The daemon already retries, hashes and scans for every client
+        # Retries run behind the menu, so their output goes to a log file instead of the prompts
+        downloader.start_retry_worker(log_path='retry_worker.log')
+        main_cli.start_hash_worker()
+        main_cli.start_background_scan(settings_cli.root_directory)
+    log_startup_phase("initialized")
+
+    # Main loop
+    while True:
+        log_startup_phase("main menu")
+        choice = main_cli.main_menu()
+        #print(f"DEBUG: User choice = {choice}")
+        if choice == 'List models':
+            main_cli.list_models_menu()
+        elif choice == 'Fetch model by ID':
+            model_id = main_cli.fetch_model_by_id()
+            model = api_handler.get_model_by_id(model_id)
+            if model:
+                # Calculate the download status
+                downloaded_versions = []  # List to store downloaded versions
+                model_versions = model.get('modelVersions', [])
+                for index_model in main_cli.model_index.values():
+                    if index_model['modelid'] == model_id:
+                        for version in model_versions:
+                            if index_model['modelversionid'] == version.get('id'):
+                                # This is a downloaded version
+                                downloaded_versions.append(version.get('name'))
+                download_status = None
+                if downloaded_versions:
+                    # If downloaded versions were found
+                    if len(downloaded_versions) < len(model_versions):
+                        # If there are more versions available than downloaded
+                        if len(downloaded_versions) == 1:
+                            download_status = f"{Fore.YELLOW}⚠️ MORE VERSIONS AVAILABLE. Version '{', '.join(downloaded_versions)}' is downloaded.{Style.RESET_ALL}"
+                        else:
+                            download_status = f"{Fore.YELLOW}⚠️ MORE VERSIONS AVAILABLE. Versions '{', '.join(downloaded_versions)}' are downloaded.{Style.RESET_ALL}"
                     else:
-                        download_status = f"{Fore.GREEN}✅ ALL VERSIONS DOWNLOADED. Versions '{', '.join(downloaded_versions)}' are downloaded.{Style.RESET_ALL}"
-            model_display.display_model_card(model, settings_cli.image_filter, download_status, image_filter_settings={})
-        else:
-            print(f"Could not fetch model with ID: {model_id}")
-    elif choice == 'Download model by ID':
-        model_id = main_cli.download_model_by_id()
-        downloader.handle_model_download_by_id(model_id)
-    elif choice == 'Fetch model version by ID':
-        model_version_id = main_cli.fetch_model_version_by_id()
-        print(f"Mock: You chose to fetch model version with ID: {model_version_id}")
-    elif choice == 'Fetch model by Hash':
-        hash_value = main_cli.fetch_model_by_hash()
-        print(f"Mock: You chose to fetch model with hash: {hash_value}")
-    elif choice == 'Scan for missing data':
-        main_cli.scan_for_missing_data_menu()        
-    elif choice == 'Download meta Data for existing models':
-        main_cli.download_metadata_menu()
-    elif choice == 'Settings':
-        settings_choice = settings_cli.settings_menu()
-        if settings_choice == 'API Endpoint Configuration':
-            settings_cli.api_endpoint_configuration()
-        elif settings_choice == 'API Key Management':
-            settings_cli.api_key_management()
-    elif choice == 'Resume interrupted Downloads':
-        for model in main_cli.selected_models_to_download:
-            main_cli.downloader.download_model_by_id(
-                model['version_id'],
-                main_cli.downloader.get_download_path(model['type']),
-                model['type']
-            )
-        main_cli.selected_models_to_download.clear()
-    elif choice == 'Exit':
-        print("Goodbye!")
-        break
+                        # If all versions are downloaded
+                        if len(downloaded_versions) == 1:
+                            download_status = f"{Fore.GREEN}✅ ALL VERSIONS DOWNLOADED. Version '{', '.join(downloaded_versions)}' is downloaded.{Style.RESET_ALL}"
+                        else:
+                            download_status = f"{Fore.GREEN}✅ ALL VERSIONS DOWNLOADED. Versions '{', '.join(downloaded_versions)}' are downloaded.{Style.RESET_ALL}"
+                model_display.display_model_card(model, settings_cli.image_filter, download_status, image_filter_settings={})
+            else:
+                print(f"Could not fetch model with ID: {model_id}")
+        elif choice == 'Download model by ID':
+            model_id = main_cli.download_model_by_id()
+            downloader.handle_model_download_by_id(model_id)
+        elif choice == 'Fetch model version by ID':
+            model_version_id = main_cli.fetch_model_version_by_id()
+            print(f"Mock: You chose to fetch model version with ID: {model_version_id}")
+        elif choice == 'Fetch model by Hash':
+            hash_value = main_cli.fetch_model_by_hash()
+            print(f"Mock: You chose to fetch model with hash: {hash_value}")
+        elif choice == 'Sync from manifest':
+            manifest_path = main_cli.sync_manifest_menu()
+            model_sync.sync(manifest_path)
+        elif choice == 'Failed downloads':
+            main_cli.failed_downloads_menu()
+        elif choice == 'Deduplicate models':
+            downloader.deduplicate_models()
+        elif choice == 'Scan for missing data':
+            main_cli.scan_for_missing_data_menu()        
+        elif choice == 'Download meta Data for existing models':
+            main_cli.download_metadata_menu()
+        elif choice == 'Settings':
+            settings_choice = settings_cli.settings_menu()
+            if settings_choice == 'API Endpoint Configuration':
+                settings_cli.api_endpoint_configuration()
+            elif settings_choice == 'API Key Management':
+                settings_cli.api_key_management()
+        elif choice == 'Resume interrupted Downloads':
+            for model in main_cli.selected_models_to_download:
+                main_cli.downloader.download_model_by_id(
+                    model['version_id'],
+                    main_cli.downloader.get_download_path(model['type']),
+                    model['type']
+                )
+            main_cli.selected_models_to_download.clear()
+        elif choice == 'Exit':
+            downloader.preview_pipeline.wait()
+            if downloader.aria2_rpc:
+                downloader.aria2_rpc.shutdown()
+            print("Goodbye!")
+            break
@@ -49,25 +49,6 @@ if ! pip freeze | grep -q -f requirements.txt; then
   pip install -r requirements.txt || exit 1
 fi
 
-# Source Rust environment variables
-source "$HOME/.cargo/env"
-
-# Check for Rust, install if not present
-if ! rustc --version >/dev/null 2>&1; then
-  #echo "Debug: Installing Rust."
-  curl --proto '=https' --tlsv1.2 -sSf https://sh.rustup.rs | sh -s -- -y || exit 1
-fi
-
-
-#echo "Debug: Checking for VIU."
-# Install VIU if not present
-if ! cargo install --list | grep -q 'viu'; then
-  git clone https://github.com/atanunq/viu.git || exit 1
-  cd viu/ || exit 1
-  cargo install --path . || exit 1
-  cd ..
-fi
-
 #echo "Debug: Running main.py."
 # Run the main program
 python main.py || python3 main.py || exit 1